@@ -0,0 +1,280 @@
+"""Local stand-ins for MusicBrainz, Cover Art Archive and YouTube.
+
+Everything is derived from the track title, so the stub MusicBrainz server,
+the fake youtube search and the cover server agree without sharing state.
+"""
+import io
+import json
+import os
+import re
+import subprocess
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+TRACKS_PER_ALBUM = 12
+FAKE_PLAYLIST_SIZE = 250
+SPOTIFY_CALLS = {}  # requests per Spotify endpoint, reset by the caller
+MUSICBRAINZ_CALLS = {}  # requests per MusicBrainz endpoint (recording search, release lookup)
+MISSING_COVER_EVERY = 10  # every n-th album has no cover (404)
+
+def _crc(text: str):
+    return zlib.crc32(text.encode())
+
+def fake_duration_ms(title: str):
+    """Duration of a fake recording, 2:00 to 4:00."""
+    return 120000 + _crc(title) % 120000
+
+def fake_track_lines(count: int):
+    """'Title - Artist' lines, TRACKS_PER_ALBUM tracks per artist/album."""
+    return [f"track {i:05d} - artist {i // TRACKS_PER_ALBUM:04d}" for i in range(count)]
+
+def _album_number(artist: str):
+    digits = re.findall(r"\d+", artist)
+    return int(digits[-1]) if digits else _crc(artist)
+
+def fake_spotify_id(number: int):
+    """22 character base62-ish track id."""
+    return f"fake{number:018d}"
+
+def fake_spotify_track(track_id: str, host: str = "127.0.0.1"):
+    number = int(re.sub(r"\D", "", track_id) or 0)
+    album = number // TRACKS_PER_ALBUM
+    return {
+        "id": track_id,
+        "type": "track",
+        "uri": f"spotify:track:{track_id}",
+        "name": f"track {number:05d}",
+        "duration_ms": fake_duration_ms(f"track {number:05d}"),
+        "artists": [{"id": f"artist{album:018d}", "name": f"artist {album:04d}"}],
+        "album": {
+            "name": f"album {album:04d}",
+            "release_date": "2001-01-01",
+            "images": [{"url": f"http://{host}/release/release-{album:04d}/front", "width": 640, "height": 640}],
+        },
+        "external_ids": {"isrc": f"XX{number:010d}"},
+    }
+
+def _artist_credit_xml(artist: str, album: int):
+    return (
+        f'<artist-credit><name-credit><artist id="artist-{album:04d}">'
+        f"<name>{escape(artist)}</name><sort-name>{escape(artist)}</sort-name>"
+        f"</artist></name-credit></artist-credit>"
+    )
+
+def _release_xml(release_id: str, title: str, date: str, secondary: str = ""):
+    types = f"<secondary-type-list><secondary-type>{secondary}</secondary-type></secondary-type-list>" if secondary else ""
+    return (
+        f'<release id="{release_id}"><title>{escape(title)}</title><status>Official</status><date>{date}</date>'
+        f'<release-group id="group-{release_id}"><primary-type>Album</primary-type>{types}</release-group>'
+        f"</release>"
+    )
+
+def _recording_xml(title: str, artist: str):
+    """The right recording, listed on a later compilation first and on its album."""
+    album = _album_number(artist)
+    return (
+        f'<recording id="rec-{_crc(title + artist):08x}" ext:score="100">'
+        f"<title>{escape(title)}</title>"
+        f"<length>{fake_duration_ms(title)}</length>"
+        f"{_artist_credit_xml(artist, album)}"
+        f'<release-list count="2">'
+        f"{_release_xml(f'best-of-{album:04d}', 'best of', '2010-01-01', 'Compilation')}"
+        f"{_release_xml(f'release-{album:04d}', f'album {album:04d}', '2001-01-01')}"
+        f"</release-list>"
+        f'<tag-list><tag count="1"><name>benchmark</name></tag></tag-list>'
+        f"</recording>"
+    )
+
+def _decoy_xml(title: str):
+    """A live take by someone else, 30s longer: limit=1 on a worse search ranking would pick it."""
+    return (
+        f'<recording id="live-{_crc(title):08x}" ext:score="90">'
+        f"<title>{escape(title)} (live)</title>"
+        f"<length>{fake_duration_ms(title) + 30000}</length>"
+        f"{_artist_credit_xml('various artists', 9999)}"
+        f'<release-list count="1">{_release_xml("live-9999", "live at the bench", "1999-01-01")}</release-list>'
+        f"</recording>"
+    )
+
+def _tracklist_xml(release_id: str):
+    album = _album_number(release_id)
+    artist = f"artist {album:04d}"
+    tracks = []
+    for position in range(TRACKS_PER_ALBUM):
+        title = f"track {album * TRACKS_PER_ALBUM + position:05d}"
+        tracks.append(
+            f'<track id="track-{_crc(title):08x}"><position>{position + 1}</position><number>{position + 1}</number>'
+            f"<length>{fake_duration_ms(title)}</length>"
+            f'<recording id="rec-{_crc(title + artist):08x}"><title>{title}</title><length>{fake_duration_ms(title)}</length>'
+            f"{_artist_credit_xml(artist, album)}</recording></track>"
+        )
+    return (
+        f'<release id="{release_id}"><title>album {album:04d}</title><status>Official</status><date>2001-01-01</date>'
+        f"{_artist_credit_xml(artist, album)}"
+        f'<release-group id="group-{release_id}"><primary-type>Album</primary-type></release-group>'
+        f'<medium-list count="1"><medium><position>1</position><track-list count="{TRACKS_PER_ALBUM}" offset="0">'
+        f"{''.join(tracks)}</track-list></medium></medium-list>"
+        f"</release>"
+    )
+
+class _Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.startswith("/api/token"):
+            return self._json({"access_token": "fake-token", "token_type": "Bearer", "expires_in": 3600})
+        self._send(404, b"not found", "text/plain")
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urllib.parse.urlparse(self.path)
+        if url.path.startswith("/v1/"):
+            return self._spotify(url)
+        if url.path.startswith("/ws/2/"):
+            endpoint = url.path.split("/")[3]
+            MUSICBRAINZ_CALLS[endpoint] = MUSICBRAINZ_CALLS.get(endpoint, 0) + 1
+        if url.path.startswith("/ws/2/recording"):
+            return self._musicbrainz_search(urllib.parse.parse_qs(url.query).get("query", [""])[0])
+        if url.path.startswith("/ws/2/release/"):
+            return self._musicbrainz_xml(_tracklist_xml(url.path.split("/")[4]))
+        if url.path.startswith("/release/") or url.path.startswith("/release-group/"):
+            return self._cover(url.path)
+        self._send(404, b"not found", "text/plain")
+
+    def _musicbrainz_search(self, query: str):
+        def field(name):
+            match = re.search(rf"{name}:\((.*?)\)(?:\s\w+:\(|$)", query)
+            return match.group(1).replace("\\", "") if match else ""
+        title, artist = field("recording"), field("artist") or "unknown artist"
+        # MusicBrainz' ranking isn't what we'd pick: the decoy comes first
+        recordings = [_decoy_xml(title), _recording_xml(title, artist)] if title else []
+        self._musicbrainz_xml(f'<recording-list count="{len(recordings)}" offset="0">{"".join(recordings)}</recording-list>')
+
+    def _musicbrainz_xml(self, content: str):
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<metadata xmlns="http://musicbrainz.org/ns/mmd-2.0#" xmlns:ext="http://musicbrainz.org/ns/ext#-2.0">'
+            f"{content}"
+            "</metadata>"
+        ).encode()
+        self._send(200, body, "application/xml; charset=UTF-8")
+
+    def _cover(self, path: str):
+        album = _album_number(path.split("/")[2])
+        if album % MISSING_COVER_EVERY == MISSING_COVER_EVERY - 1:
+            return self._send(404, b"no cover", "text/plain")
+        # Bigger than MAX_COVER_SIZE, so the thumbnail step does real work
+        img = Image.new("RGB", (1400, 1400), (album * 37 % 256, album * 91 % 256, 128))
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=90)
+        self._send(200, buffer.getvalue(), "image/jpeg")
+
+    def _json(self, data: dict, status: int = 200):
+        self._send(status, json.dumps(data).encode(), "application/json")
+
+    def _spotify(self, url):
+        if self.headers.get("Authorization") != "Bearer fake-token":
+            return self._json({"error": {"status": 401, "message": "Invalid access token"}}, 401)
+        query = urllib.parse.parse_qs(url.query)
+        ids = query.get("ids", [""])[0].split(",")
+        endpoint = url.path.split("/")[2]
+        SPOTIFY_CALLS[endpoint] = SPOTIFY_CALLS.get(endpoint, 0) + 1
+        if endpoint == "tracks":
+            return self._json({"tracks": [fake_spotify_track(i, self.headers["Host"]) for i in ids]})
+        if endpoint == "artists":
+            return self._json({"artists": [
+                {"id": i, "name": f"artist {i}", "genres": ["benchmark", f"genre {_crc(i) % 7}"]} for i in ids
+            ]})
+        if endpoint == "playlists":
+            total = FAKE_PLAYLIST_SIZE
+            offset, limit = int(query.get("offset", ["0"])[0]), int(query.get("limit", ["100"])[0])
+            items = [{"track": fake_spotify_track(fake_spotify_id(n), self.headers["Host"])} for n in range(offset, min(total, offset + limit))]
+            more = offset + limit < total
+            return self._json({"items": items, "total": total, "next": f"{self.path}&more" if more else None})
+        self._json({"error": {"status": 404, "message": "not found"}}, 404)
+
+def start_server(latency: float = 0.0):
+    """Stub MusicBrainz + Cover Art Archive server on a free localhost port."""
+    handler = type("Handler", (_Handler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name="fake-server", daemon=True).start()
+    return server
+
+class FakeYoutubeDL:
+    """Drop-in for yt_dlp.YoutubeDL: canned search entries, lavfi generated audio."""
+
+    latency = 0.0        # seconds per search / download call
+    audio_seconds = 10   # length of the generated audio, whatever the fake duration
+
+    def __init__(self, opts: dict = None):
+        self.opts = opts or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def extract_info(self, query: str, download: bool = False):
+        time.sleep(self.latency)
+        match = re.match(r"ytsearch(\d*):(.*)", query)
+        if not match:
+            video_id = urllib.parse.parse_qs(urllib.parse.urlparse(query).query).get("v", ["fake"])[0]
+            return {"id": video_id, "url": query, "title": video_id}
+        count = int(match.group(1) or 1)
+        search = re.sub(r"( topic| AND lyrics)$", "", match.group(2))
+        title = search.rsplit(" - ", 1)[0]
+        target = fake_duration_ms(title) // 1000
+        entries = []
+        for position in range(count):
+            # Third result is the right one, the others are off by 5+ seconds
+            duration = target if position == 2 else target + 5 + position * 7
+            video_id = f"{_crc(search):08x}{position:02d}"[:11]
+            entries.append({
+                "id": video_id,
+                "webpage_url": f"https://www.youtube.com/watch?v={video_id}",
+                "duration": duration,
+                "uploader": f"{search.rsplit(' - ', 1)[-1]} - Topic" if position == 2 else "someone",
+                "title": search if position == 2 else f"{search} (live)",
+            })
+        return {"entries": entries}
+
+    def download(self, urls: list):
+        for url in urls:
+            time.sleep(self.latency)
+            video_id = urllib.parse.parse_qs(urllib.parse.urlparse(url).query).get("v", ["0"])[0]
+            # Alternate sine and noise, both are cheap to make and not trivial to encode
+            if _crc(video_id) % 2:
+                source = f"sine=frequency={220 + _crc(video_id) % 660}:duration={self.audio_seconds}"
+            else:
+                source = f"anoisesrc=d={self.audio_seconds}:c=pink:a=0.2"
+            cmd = [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-f", "lavfi", "-i", source,
+                "-ac", "2", "-ar", "48000",
+                "-c:a", "libopus", "-b:a", "160k", "-f", "webm",
+                self.opts["outtmpl"]
+            ]
+            subprocess.run(cmd, check=True)
+            size = os.path.getsize(self.opts["outtmpl"])
+            for hook in self.opts.get("progress_hooks", []):
+                hook({"status": "finished", "downloaded_bytes": size, "total_bytes": size, "filename": self.opts["outtmpl"]})
+        return 0
@@ -0,0 +1,251 @@
+"""Offline benchmark of the download chain against the local fakes of bench/fakes.py.
+
+    python -m bench.run --tracks 1 100 1000 [--parallel] [--fused | --passthrough] [--runs 2]
+
+Every batch size runs in its own worker process and scratch directory, so
+caches, the done index and peak RSS never leak from one size into the next.
+Runs after the first reuse the lookup/loudness caches (output and done index
+are wiped) which shows what the caches save.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from functools import partial, wraps
+from pathlib import Path
+
+from src.metrics import percentile, summary
+
+REPO = Path(__file__).resolve().parent.parent
+
+# main.py functions timed per call
+TIMED = [
+    "get_metadata_musicbrainz", "get_youtube_link", "download_audio", "analyze_audio",
+    "normalize_audio", "embed_metadata", "compress_audio", "fused_audio", "remux_audio",
+]
+
+def _timed(name: str, func, timings_path: str):
+    """Wrap func to append its wall time to timings_path (works from pool processes too)."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            line = json.dumps({"stage": name, "seconds": time.perf_counter() - start}) + "\n"
+            with open(timings_path, "a", encoding="utf-8") as file:
+                file.write(line)
+    return wrapper
+
+def _disk_usage(path: str):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError: # removed while walking
+                pass
+    return total
+
+class DiskSampler(threading.Thread):
+    """Peak bytes under a directory, sampled in the background."""
+
+    def __init__(self, path: str, interval: float = 0.2):
+        super().__init__(name="disk-sampler", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, _disk_usage(self.path))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, _disk_usage(self.path))
+        return self.peak
+
+def _stage_stats(timings_path: str):
+    by_stage = {}
+    if os.path.exists(timings_path):
+        with open(timings_path, encoding="utf-8") as file:
+            for line in file:
+                record = json.loads(line)
+                by_stage.setdefault(record["stage"], []).append(record["seconds"])
+    return {
+        stage: {
+            "count": len(values),
+            "mean": round(sum(values) / len(values), 4),
+            "p50": round(percentile(values, 50), 4),
+            "p95": round(percentile(values, 95), 4),
+        }
+        for stage, values in by_stage.items()
+    }
+
+def _reset_outputs(main):
+    """Drop produced files and job state, keep the lookup/loudness caches."""
+    shutil.rmtree("output", ignore_errors=True)
+    for db in (main.DONE.path, main.MANIFEST.path):
+        for suffix in ("", "-wal", "-shm"):
+            Path(db + suffix).unlink(missing_ok=True)
+    for store in (main.DONE, main.MANIFEST):
+        store._local = threading.local()
+
+def worker(args):
+    """One batch size, run from inside its scratch directory."""
+    import logging
+
+    import musicbrainzngs
+
+    from bench import fakes
+
+    server = fakes.start_server(latency=args.latency)
+    host = f"127.0.0.1:{server.server_address[1]}"
+
+    import main
+    main.setup_logging()
+    # Keep the terminal quiet, the log file still gets everything
+    for handler in logging.getLogger().handlers:
+        if type(handler) is not logging.FileHandler:
+            handler.setLevel(logging.CRITICAL + 1)
+    musicbrainzngs.set_hostname(host, use_https=False)
+    # Local fakes, nothing to protect
+    for name in main.LIMITER.buckets:
+        main.LIMITER.configure(name, 0)
+    main.COVER_ART_ARCHIVE = f"http://{host}"
+    fakes.FakeYoutubeDL.latency = args.latency
+    fakes.FakeYoutubeDL.audio_seconds = args.audio_seconds
+    main.YoutubeDL = fakes.FakeYoutubeDL
+    main.SEARCH_MODE = args.search_mode
+
+    lines = fakes.fake_track_lines(args.worker)
+    options = {"fused": args.fused, "passthrough": args.passthrough, "manifest": True, "resume": False, "metrics": "assets/metrics.jsonl",
+               "scratch": args.scratch or None}
+    originals = {name: getattr(main, name) for name in TIMED}
+    runs = []
+    for run in range(args.runs):
+        if run:
+            _reset_outputs(main)
+        timings_path = os.path.abspath(f"timings_{run}.jsonl")
+        for name, func in originals.items():
+            setattr(main, name, _timed(name, func, timings_path))
+
+        fakes.MUSICBRAINZ_CALLS.clear()
+        sampler = DiskSampler(".")
+        sampler.start()
+        start = time.perf_counter()
+        jobs = main.prepare_jobs(lines, options)
+        if args.parallel:
+            stages = [(name, partial(main.run_stage, name), kind, default) for name, _, kind, default in main.STAGES]
+            results = [main.finish_job(job) for job in main.run_pipeline(jobs, stages)]
+        else:
+            results = [main.run_job(job) for job in jobs]
+        wall = time.perf_counter() - start
+        peak_disk = sampler.stop()
+
+        statuses = {}
+        for job in results:
+            statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        runs.append({
+            "run": run + 1,
+            "wall_seconds": round(wall, 3),
+            "tracks_per_minute": round(len(results) / wall * 60, 2) if wall else None,
+            "statuses": statuses,
+            "peak_disk_mb": round(peak_disk / 2**20, 2),
+            "stages": _stage_stats(timings_path),
+            "metrics": summary(results),
+            "musicbrainz_calls": dict(fakes.MUSICBRAINZ_CALLS),
+        })
+
+    server.shutdown()
+    # ru_maxrss is in KiB on Linux, children = ffmpeg and pool workers
+    print(json.dumps({
+        "tracks": args.worker,
+        "runs": runs,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_rss_children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }))
+
+def _worker_cmd(args, size: int):
+    cmd = [
+        sys.executable, "-m", "bench.run", "--worker", str(size),
+        "--audio-seconds", str(args.audio_seconds), "--latency", str(args.latency),
+        "--search-mode", args.search_mode, "--runs", str(args.runs),
+    ]
+    if args.parallel:
+        cmd.append("--parallel")
+    if args.fused:
+        cmd.append("--fused")
+    if args.passthrough:
+        cmd.append("--passthrough")
+    if args.scratch:
+        cmd += ["--scratch", args.scratch]
+    return cmd
+
+def print_report(results: list):
+    for result in results:
+        print(f"\n=== {result['tracks']} track(s) | peak RSS {result['peak_rss_mb']} MB"
+              f" (children {result['peak_rss_children_mb']} MB) ===")
+        for run in result["runs"]:
+            print(f"run {run['run']}: {run['wall_seconds']}s, {run['tracks_per_minute']} tracks/min,"
+                  f" peak disk {run['peak_disk_mb']} MB, {run['statuses']}")
+            cpu = sum(stats["total"] for stats in run["metrics"]["ffmpeg_cpu"].values())
+            print(f"  ffmpeg CPU {cpu:.2f}s, {run['metrics']['search_queries']} search queries,"
+                  f" {run['metrics']['bytes_downloaded'] / 2**20:.1f} MB downloaded,"
+                  f" fallback depths {run['metrics']['fallback_depth']}")
+            print(f"  MusicBrainz calls {run['musicbrainz_calls']}")
+            print(f"  {'stage':<26}{'count':>7}{'mean':>10}{'p50':>10}{'p95':>10}")
+            for stage in TIMED:
+                stats = run["stages"].get(stage)
+                if stats:
+                    print(f"  {stage:<26}{stats['count']:>7}{stats['mean']:>10.4f}{stats['p50']:>10.4f}{stats['p95']:>10.4f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of main.py against local fakes")
+    parser.add_argument("--tracks", nargs="+", type=int, default=[1, 100, 1000], help="Batch sizes to run")
+    parser.add_argument("--parallel", action="store_true", help="Use the concurrent stage pipeline (main.py --parallel)")
+    parser.add_argument("--fused", action="store_true", help="Single ffmpeg run per track (main.py --fused)")
+    parser.add_argument("--passthrough", action="store_true", help="Remux instead of re-encoding (main.py --passthrough)")
+    parser.add_argument("--search-mode", default="fallback", choices=["fallback", "scored"], help="main.py --search-mode")
+    parser.add_argument("--audio-seconds", type=float, default=10, help="Length of the generated audio per track")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every fake service call takes")
+    parser.add_argument("--scratch", default="", help="Tmp file location (main.py --scratch), e.g. /dev/shm")
+    parser.add_argument("--runs", type=int, default=1, help="Runs per size, later runs reuse the lookup caches")
+    parser.add_argument("--output", default="", help="Also write the raw results as JSON here")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directories")
+    parser.add_argument("--worker", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args)
+        sys.exit(0)
+
+    if shutil.which("ffmpeg") is None:
+        raise SystemExit("ffmpeg is needed for the benchmark (it generates and encodes the audio)")
+
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO), os.environ.get("PYTHONPATH")]))}
+    results = []
+    for size in args.tracks:
+        workdir = tempfile.mkdtemp(prefix=f"bench_{size}_")
+        print(f"Running {size} track(s) in {workdir} ...", flush=True)
+        with open(os.path.join(workdir, "bench.log"), "w", encoding="utf-8") as log:
+            proc = subprocess.run(_worker_cmd(args, size), cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=log, text=True)
+        if proc.returncode != 0:
+            print(f"❌ {size} track(s) failed, see {workdir}/bench.log")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2), "UTF-8")
@@ -0,0 +1,52 @@
+"""Spotify metadata resolution against the fake Web API of bench/fakes.py.
+
+    python -m bench.spotify --tracks 1000
+
+Resolves track URIs through src.spotify.resolve_lines, then the fake
+playlist, and reports API calls against the two per track of the old
+per-track lookups. Runs in a temp folder so the artist cache starts empty.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from bench import fakes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Spotify resolution benchmark against a local fake")
+    parser.add_argument("--tracks", type=int, default=1000, help="Track URIs to resolve")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every fake call takes")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_spotify_")
+    os.chdir(workdir)
+    from src.ratelimit import LIMITER
+    from src.spotify import SpotifyClient, resolve_lines
+
+    server = fakes.start_server(latency=args.latency)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    LIMITER.configure("spotify", 0)
+    lines = [f"spotify:track:{fakes.fake_spotify_id(n)}" for n in range(args.tracks)]
+
+    # Second round: new client (empty memory cache), the artists come from the lookup cache
+    for label in ("cold", "warm artist cache"):
+        client = SpotifyClient("id", "secret", f"{base}/v1", f"{base}/api/token")
+        fakes.SPOTIFY_CALLS.clear()
+        start = time.perf_counter()
+        records = list(resolve_lines(lines, client))
+        wall = time.perf_counter() - start
+        complete = sum(record["complete"] for record in records)
+        print(f"{label}: {len(records)} tracks ({complete} complete) in {wall:.2f}s,"
+              f" {client.calls} API calls {dict(fakes.SPOTIFY_CALLS)} (per track lookups: {2 * args.tracks})")
+
+    fakes.SPOTIFY_CALLS.clear()
+    client = SpotifyClient("id", "secret", f"{base}/v1", f"{base}/api/token")
+    start = time.perf_counter()
+    records = list(resolve_lines([f"https://open.spotify.com/playlist/{fakes.fake_spotify_id(0)}"], client))
+    print(f"playlist: {len(records)} tracks in {time.perf_counter() - start:.2f}s, {client.calls} API calls {dict(fakes.SPOTIFY_CALLS)}")
+
+    server.shutdown()
+    os.chdir("/")
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -9,7 +9,7 @@ cd $DIR/../..
 source PYTHON_ENV/bin/activate
 pip install --upgrade -r "./requirements.txt"
 
-cmd="python playlist.py"
+cmd="python -m src.playlist"
 
 read -p "Enter CSV File Path : " csv
 [ -n "$csv" ] && cmd="$cmd --csv \"$csv\"" # Add Command
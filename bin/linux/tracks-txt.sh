@@ -9,4 +9,4 @@ cd $DIR/../..
 source PYTHON_ENV/bin/activate
 pip install --upgrade -r "./requirements.txt"
 
-xargs -I {} command_name arguments {} < input.txt
\ No newline at end of file
+python main.py --batch assets/tracks.txt
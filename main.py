@@ -1,71 +1,243 @@
-import random
+import time
+STARTED = time.perf_counter()  # startup time is reported from here
 import sys
 import logging
-import colorlog
 import os
 import io
 import json
-import time
+import math
 import re
 import argparse
+import difflib
+import importlib
+import threading
+import urllib.parse
 import subprocess
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 
-from PIL import Image
-import requests
-from yt_dlp import YoutubeDL
-import musicbrainzngs
+# yt_dlp, PIL, musicbrainzngs, requests and colorlog are imported on first use,
+# a re-run whose tracks all exist never loads them
+from src.cache import CACHE, DAY, cache_key
+from src.dedupe import DONE
+from src.library import LibraryIndex
+from src.loudness import LOUDNESS, content_hash, measure_loudness
+from src import metrics
+from src.manifest import MANIFEST, job_id
+from src.naming import sanitize_filename
+from src.net import RETRY_STATUS, SETTINGS as NETWORK_SETTINGS, configure as configure_network, http_get, parse_retry_after, retry_call, ytdlp_opts
+from src.pipeline import process_pool, run_pipeline
+from src.ratelimit import HIGH, LIMITER, LOW
+from src.releases import RELEASES, best_candidate, first_artist, is_compilation, parse_release
+from src.spotify import SPOTIFY, SpotifyError, parse_spotify, resolve_lines, track_record
+from src.transcode import TRANSCODES
 
-# Initialize the client with a descriptive user-agent string
-musicbrainzngs.set_useragent("SongDownloader", "2.0", "contact@example.com")
+def setup_logging():
+    """Log file + colored terminal output, done by the entry point once it knows there is work."""
+    import colorlog
 
-# Configure logging
-if not Path("assets/song_downloader.log").exists():
-    Path("assets").mkdir(exist_ok=True)
-    Path("assets/song_downloader.log").write_text("", "UTF-8")
-    
-logger = logging.getLogger()
-logging.basicConfig(
-    filename="assets/song_downloader.log",     # log file name
-    filemode="a",
-    encoding="utf-8",
-    level=logging.INFO,                 # log level: DEBUG, INFO, WARNING, ERROR
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
-
-# beautiful horses color to logging
-formatter = colorlog.ColoredFormatter(
-    "%(log_color)s%(levelname)-8s%(reset)s %(blue)s%(message)s",
-    datefmt=None,
-    reset=True,
-    log_colors={
-        'DEBUG':    'cyan',
-        'INFO':     'green',
-        'WARNING':  'yellow',
-        'ERROR':    'red',
-        'CRITICAL': 'red,bg_white',  # Red text on a white background
-    },
-    secondary_log_colors={},
-    style='%'
-)
-handler = colorlog.StreamHandler() # Output to Terminal too
-handler.setFormatter(formatter)
-logger.addHandler(handler) # add handler for color format
+    # Configure logging
+    if not Path("assets/song_downloader.log").exists():
+        Path("assets").mkdir(exist_ok=True)
+        Path("assets/song_downloader.log").write_text("", "UTF-8")
 
+    logger = logging.getLogger()
+    logging.basicConfig(
+        filename="assets/song_downloader.log",     # log file name
+        filemode="a",
+        encoding="utf-8",
+        level=logging.INFO,                 # log level: DEBUG, INFO, WARNING, ERROR
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
+    # beautiful horses color to logging
+    formatter = colorlog.ColoredFormatter(
+        "%(log_color)s%(levelname)-8s%(reset)s %(blue)s%(message)s",
+        datefmt=None,
+        reset=True,
+        log_colors={
+            'DEBUG':    'cyan',
+            'INFO':     'green',
+            'WARNING':  'yellow',
+            'ERROR':    'red',
+            'CRITICAL': 'red,bg_white',  # Red text on a white background
+        },
+        secondary_log_colors={},
+        style='%'
+    )
+    handler = colorlog.StreamHandler() # Output to Terminal too
+    handler.setFormatter(formatter)
+    logger.addHandler(handler) # add handler for color format
 
 logging.getLogger("musicbrainzngs").setLevel(logging.WARNING)
+COVER_ART_ARCHIVE = "https://coverartarchive.org"
+
+def _timed_import(name: str):
+    """Import a heavy dependency on first use, logs what it cost."""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    logging.debug("Imported %s in %.2fs", name, time.perf_counter() - start)
+    return module
+
+YoutubeDL = None  # yt_dlp.YoutubeDL, by far the slowest import, see _youtube_dl()
+
+def _youtube_dl(opts: dict):
+    global YoutubeDL
+    if YoutubeDL is None:
+        YoutubeDL = _timed_import("yt_dlp").YoutubeDL
+    return YoutubeDL(opts)
+
+_musicbrainz_ready = False
+
+def _musicbrainz():
+    """musicbrainzngs, set up on first use."""
+    global _musicbrainz_ready
+    musicbrainzngs = _timed_import("musicbrainzngs")
+    if not _musicbrainz_ready:
+        # Initialize the client with a descriptive user-agent string
+        musicbrainzngs.set_useragent("SongDownloader", "2.0", "contact@example.com")
+        # Paced by src/ratelimit.py instead, its bucket is shared with the pool workers
+        musicbrainzngs.set_rate_limit(False)
+        _musicbrainz_ready = True
+    return musicbrainzngs
+
+MUSICBRAINZ_TTL = 30 * DAY
+MUSICBRAINZ_NEGATIVE_TTL = 1 * DAY
+MUSICBRAINZ_CANDIDATES = 10  # search hits scored per lookup (src/releases.py)
+
 def get_metadata_musicbrainz(title: str, artist: str):
-    # Search for the recording
+    # Served from the persistent cache if looked up before (None = known miss)
+    key = cache_key(title, artist)
+    hit, metadata = CACHE.get("musicbrainz", key, MUSICBRAINZ_TTL, MUSICBRAINZ_NEGATIVE_TTL)
+    if hit:
+        logging.debug("MusicBrainz cache hit for '%s - %s'", title, artist)
+        if metadata and artist != "Unknown Artist": # siblings can still come from its release
+            RELEASES.note(artist, metadata["release_id"], metadata["genres"])
+        return metadata
+    metadata = _from_release(title, artist) or _search_musicbrainz(title, artist)
+    CACHE.set("musicbrainz", key, metadata)
+    return metadata
+
+def _get_release(release_id: str):
+    """Tracklist of a release (see src.releases.parse_release), cached; None if it can't be had."""
+    hit, release = CACHE.get("musicbrainz_release", release_id, MUSICBRAINZ_TTL, MUSICBRAINZ_NEGATIVE_TTL)
+    if hit:
+        return release
+    musicbrainzngs = _musicbrainz()
+    try:
+        result = retry_call(
+            _musicbrainz_call, musicbrainzngs.get_release_by_id, id=release_id,
+            includes=["recordings", "artist-credits", "tags", "release-groups"],
+            should_retry=_musicbrainz_retry, describe="MusicBrainz release lookup"
+        )
+    except musicbrainzngs.WebServiceError as e: # the track is searched for instead
+        logging.warning("Can't resolve release '%s': %s", release_id, str(e))
+        return None
+    release = parse_release(result["release"])
+    CACHE.set("musicbrainz_release", release_id, release)
+    return release
+
+def _from_release(title: str, artist: str):
+    """Metadata of a track on a release resolved for an earlier track of the same artist."""
+    if artist == "Unknown Artist":
+        return None
+    metadata = RELEASES.match(title, artist)
+    # Another track of this artist came up before: its release may have this one too
+    if metadata is None:
+        release_id = RELEASES.claim(artist)
+        if release_id is None:
+            return None
+        RELEASES.add(release_id, _get_release(release_id))
+        metadata = RELEASES.match(title, artist)
+        if metadata is None: # one lookup per track at most, it's searched for now
+            RELEASES.miss(artist)
+            return None
+    logging.info("'%s - %s' is on the release '%s', no search needed", title, artist, metadata["album"])
+    return _with_cover(metadata)
+
+def _with_cover(metadata: dict):
+    # Fetch cover art URL if a release ID exists
+    if metadata["release_id"]:
+        metadata["cover_url"] = f"{COVER_ART_ARCHIVE}/release/{metadata['release_id']}/front" # TODO: Natively download Image
+        metadata["cover_url_fallback"] = f"{COVER_ART_ARCHIVE}/release-group/{metadata['release_id']}/front" # TODO: Natively download Image
+    else:
+        metadata["cover_url"] = 'https://None'
+        logging.critical(
+            "No Song Cover found using '%s' return: '%s'",
+            metadata['release_id'],
+            metadata["cover_url"]
+        )
+    return metadata
+
+def _musicbrainz_retry(e: Exception):
+    """Retry MusicBrainz on network errors and 429/5xx (honouring Retry-After)."""
+    musicbrainzngs = _musicbrainz()
+    if isinstance(e, musicbrainzngs.NetworkError):
+        return True, None
+    if isinstance(e, musicbrainzngs.ResponseError):
+        cause = getattr(e, "cause", None)
+        code = getattr(cause, "code", None)
+        if code in RETRY_STATUS:
+            headers = getattr(cause, "headers", None) or {}
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            if code in (429, 503): # MusicBrainz answers 503 when over the limit
+                LIMITER.penalize("musicbrainz", retry_after)
+            return True, retry_after
+    return False, None
+
+def _musicbrainz_call(func, **kwargs):
+    """One MusicBrainz request, in line with the shared rate limit."""
+    LIMITER.wait("musicbrainz", HIGH)
+    result = func(**kwargs)
+    LIMITER.reward("musicbrainz")
+    return result
+
+# yt-dlp errors that mean YouTube wants us slower, everything else (unavailable,
+# private, geo blocked, ...) fails the same way on every attempt
+_THROTTLED = re.compile(r"429|too many requests|rate.?limit|sign in to confirm|not a bot|captcha", re.IGNORECASE)
+
+def _youtube_throttled(e: Exception):
+    return bool(_THROTTLED.search(str(e)))
+
+def _youtube_retry(e: Exception):
+    """Back off and retry on throttling, fail fast on anything else (yt-dlp retried that already)."""
+    if not _youtube_throttled(e):
+        return False, None
+    LIMITER.penalize("youtube")
+    return True, None
+
+def _youtube_call(func, *args, priority: int = HIGH, **kwargs):
+    """One YouTube extractor call, in line with the shared rate limit."""
+    LIMITER.wait("youtube", priority)
+    result = func(*args, **kwargs)
+    LIMITER.reward("youtube")
+    return result
+
+def _search_musicbrainz(title: str, artist: str):
+    musicbrainzngs = _musicbrainz()
+    # Search for the recording, the best of several candidates wins
     if artist == "Unknown Artist":
         logging.info("No Artist defined, searching using title only")
-        result = musicbrainzngs.search_recordings(recording=title, limit=1)
+        result = retry_call(
+            _musicbrainz_call, musicbrainzngs.search_recordings, recording=title, limit=MUSICBRAINZ_CANDIDATES,
+            should_retry=_musicbrainz_retry, describe="MusicBrainz search"
+        )
     else:
-        result = musicbrainzngs.search_recordings(artist=artist, recording=title, limit=1)
+        result = retry_call(
+            _musicbrainz_call, musicbrainzngs.search_recordings, artist=artist, recording=title, limit=MUSICBRAINZ_CANDIDATES,
+            should_retry=_musicbrainz_retry, describe="MusicBrainz search"
+        )
     
-    if not result['recording-list']:
+    best = best_candidate(result['recording-list'], title, artist)
+    if best is None:
         return None
-        
-    track = result['recording-list'][0] # TODO: Improve search
+    track, release, score = best
+    logging.debug("MusicBrainz match '%s' on '%s' (score %.2f)", track.get("title"), release.get("title"), score)
     
     # Process systematic variables
     GENRES = [
@@ -80,53 +252,23 @@ def get_metadata_musicbrainz(title: str, artist: str):
             if "name" in t
         ]
     metadata = {
+        "recording_id": track.get("id"),
         "title": track.get("title"),
-        "artist": track.get("artist-credit", [{}])[0].get("artist", {}).get("name"),
+        "artist": first_artist(track),
         "duration_ms": int(track.get("length", 0)),  # Duration in milliseconds
-        "release_id": track.get("release-list", [{}])[0].get("id"),
-        "album": track.get("release-list", [{}])[0].get("title"),
-        "date": track.get("release-list", [{}])[0].get("date"),
+        "release_id": release.get("id"),
+        "album": release.get("title"),
+        "date": release.get("date"),
         "genres": GENRES
     }
-    # Fetch cover art URL if a release ID exists
-    if metadata["release_id"]:
-        metadata["cover_url"] = f"https://coverartarchive.org/release/{metadata['release_id']}/front" # TODO: Natively download Image
-        metadata["cover_url_fallback"] = f"https://coverartarchive.org/release-group/{metadata['release_id']}/front" # TODO: Natively download Image
-    else:
-        metadata["cover_url"] = 'https://None'
-        logging.critical(
-            "No Song Cover found using '%s' return: '%s'",
-            metadata['release_id'],
-            metadata["cover_url"]
-        )
-        
-    return metadata
+    # A compilation's other tracks are mostly someone else's
+    if artist != "Unknown Artist" and not is_compilation(release):
+        RELEASES.note(artist, metadata["release_id"], GENRES)
+    return _with_cover(metadata)
 
-def sanitize_filename(song_artists: str):
-    # Split song and artist
-    if ' - ' in song_artists:
-        song_name, artists = song_artists.rsplit(' - ', 1)
-    else:
-        # If no ' - ', treat the whole string as song name
-        song_name = song_artists
-        artists = "Unknown Artist"
-    # Remove invalid characters
-    song_name = re.sub(r'[<>:"/\\|?*]', '', song_name)
-    artists = re.sub(r'[<>:"/\\|?*]', '', artists)
-    # trim to a maximum length
-    max_length_artists = 100
-    max_length_song = 50
-    if len(song_name) > max_length_song:
-        song_name = song_name[:max_length_song].rstrip()
-    if len(artists) > max_length_artists:
-        artists = artists[:max_length_artists].rstrip()
-    logging.debug("%s - %s", song_name, song_artists)
-    #return f'{song_name} - {artists}'
-    song_title_artists = {
-        "title": song_name,
-        "artist": artists
-    }
-    return song_title_artists
+def _count_download(progress: dict):
+    if progress.get("status") == "finished":
+        metrics.add("bytes_downloaded", progress.get("downloaded_bytes") or progress.get("total_bytes") or 0)
 
 def download_audio(file, url):
     """Download audio from YouTube video URL."""
@@ -135,41 +277,41 @@ def download_audio(file, url):
         'outtmpl': file,
         'noplaylist': True,
         'quiet': False,  # Show progress during download
+        'progress_hooks': [_count_download],
     }   
-    # download
-    with YoutubeDL(ydl_opts) as ydl:
+    # download, yt-dlp retries internally, whole attempts back off on top of that
+    with _youtube_dl({**ytdlp_opts(), **ydl_opts}) as ydl:
         try:
-            ydl.download([url])
+            retry_call(
+                _youtube_call, ydl.download, [url], priority=LOW,
+                should_retry=_youtube_retry, describe=f"Download ({url})"
+            )
         except Exception as e:
             logging.debug("ERROR while downloading: %s", str(e))
-            logging.info("Couldn't download (%s), trying again...", url)
-            try:
-                time.sleep(random.uniform(0.93, 2.84))
-                ydl.download([url])
-                logging.info("Trying to download (%s) again succeeded", url)
-                return 0
-            except Exception as e2:
-                logging.debug("ERROR while downloading: %s", str(e2))
-                logging.error("Download Failed for (%s): quitting whole program\n", url)
-                sys.exit(1)
+            logging.error("Download Failed for (%s): skipping track\n", url)
+            return 1
         logging.debug("Downloaded '%s'", url)
+    return 0
+
+# loudnorm target, also part of the loudness cache key
+LOUDNORM_TARGET = "I=-14:TP=-1.5:LRA=14"
 
 def analyze_audio(file):
     cmd = [
         "ffmpeg", "-i", file,
-        "-af", "loudnorm=I=-14:TP=-1.5:LRA=14:print_format=json",
+        "-af", f"loudnorm={LOUDNORM_TARGET}:print_format=json",
         "-f", "null", "-"
     ]
-    result = subprocess.run(cmd, stderr=subprocess.PIPE, check=False, text=True)
+    result = metrics.run(cmd, stderr=subprocess.PIPE, check=False, text=True)
     output = result.stderr
     json_start = output.find("{")
     json_end = output.rfind("}") + 1
     logging.debug("Analysed audio and return loudnorm input values")
     return json.loads(output[json_start:json_end])
 
-def normalize_audio(file, decoy_file, measure_value):
-    filter_settings = (
-        f"loudnorm=I=-14:TP=-1.5:LRA=14:"
+def _loudnorm_filter(measure_value):
+    return (
+        f"loudnorm={LOUDNORM_TARGET}:"
         f"measured_I={measure_value['input_i']}:"
         f"measured_TP={measure_value['input_tp']}:"
         f"measured_LRA={measure_value['input_lra']}:"
@@ -177,13 +319,104 @@ def normalize_audio(file, decoy_file, measure_value):
         f"offset={measure_value['target_offset']}:"
         f"linear=true:print_format=summary"
     )
-    cmd = ["ffmpeg", "-i", file, "-af", filter_settings, decoy_file]
-    subprocess.run(cmd, check=False)
+
+def normalize_audio(file, decoy_file, measure_value):
+    # Same 48kHz as fused mode, loudnorm would hand out 192kHz (4x the scratch data)
+    filter_settings = f"{_loudnorm_filter(measure_value)},aresample=48000"
+    cmd = ["ffmpeg", "-y", "-i", file, "-af", filter_settings, decoy_file]
+    metrics.run(cmd, check=False)
     logging.debug("Applying Norm")
 
+STREAM_CHUNK = 256 * 1024
+STREAM_RANGE = 10 * 1024 * 1024  # bytes per ranged GET, unless the format sets http_chunk_size
+
+def _stream_ranges(info: dict):
+    """Yield the bytes of an http format in Range requests, like yt-dlp downloads it.
+
+    YouTube throttles one long GET of a whole file. A server that ignores the
+    Range header (200 instead of 206) is read in one go.
+    """
+    size = (info.get("downloader_options") or {}).get("http_chunk_size") or STREAM_RANGE
+    total = info.get("filesize")
+    start = 0
+    while total is None or start < total:
+        headers = {**(info.get("http_headers") or {}), "Range": f"bytes={start}-{start + size - 1}"}
+        response = http_get(info["url"], priority=LOW, headers=headers, stream=True)
+        if response.status_code == 416 and start: # the last range ended right at the end
+            return
+        response.raise_for_status()
+        received = 0
+        for chunk in response.iter_content(STREAM_CHUNK):
+            received += len(chunk)
+            yield chunk
+        if response.status_code != 206:
+            return
+        content_range = response.headers.get("Content-Range", "")
+        if content_range.rpartition("/")[2].isdigit():
+            total = int(content_range.rpartition("/")[2])
+        start += received
+        if received < size: # short range: that was the end
+            return
+
+def stream_audio(file, url):
+    """Download url into file while ffmpeg measures its loudness from the same bytes.
+
+    Returns the loudnorm measurement, None when the format can't be streamed
+    (the caller falls back to download_audio) or the analysis failed
+    (file is complete, normalize analyses it again).
+    """
+    ydl_opts = {'format': 'bestaudio', 'noplaylist': True, 'quiet': True}
+    with _youtube_dl({**ytdlp_opts(), **ydl_opts}) as ydl:
+        info = retry_call(
+            _youtube_call, ydl.extract_info, url, download=False, priority=LOW,
+            should_retry=_youtube_retry, describe=f"Format lookup ({url})"
+        )
+    if info.get("protocol") not in ("http", "https") or not info.get("url"):
+        logging.debug("Format of (%s) is '%s', not streamable", url, info.get("protocol"))
+        return None
+
+    cmd = ["ffmpeg", "-i", "pipe:0", "-af", f"loudnorm={LOUDNORM_TARGET}:print_format=json", "-f", "null", "-"]
+    analysis = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    # stderr is read on the side, a full pipe would stall ffmpeg and with it the download
+    output = []
+    reader = threading.Thread(target=lambda: output.append(analysis.stderr.read()), daemon=True)
+    reader.start()
+    feeding = True
+    # Renamed when complete, an interrupted stream never looks like a finished download
+    # (not file + ".part", that's where yt-dlp would resume from)
+    part = f"{file}.stream.part"
+    try:
+        with open(part, "wb") as out:
+            for chunk in _stream_ranges(info):
+                out.write(chunk)
+                metrics.add("bytes_downloaded", len(chunk))
+                if feeding:
+                    try:
+                        analysis.stdin.write(chunk)
+                    except BrokenPipeError: # ffmpeg gave up, the download goes on
+                        feeding = False
+        os.replace(part, file)
+    finally:
+        Path(part).unlink(missing_ok=True)
+        try:
+            analysis.stdin.close()
+        except BrokenPipeError:
+            pass
+        reader.join()
+        metrics.reap(analysis)
+
+    stderr = (output[0] if output else b"").decode("utf-8", "replace")
+    json_start = stderr.find("{")
+    json_end = stderr.rfind("}") + 1
+    if not feeding or analysis.returncode != 0 or json_start < 0:
+        logging.warning("Streamed loudness analysis failed for (%s), measuring after the download", url)
+        return None
+    logging.debug("Streamed (%s) and measured its loudness on the way", url)
+    return json.loads(stderr[json_start:json_end])
+
 def get_metadata_ytdlp(url: str):
-    with YoutubeDL() as ydl:
-        info_dict = ydl.extract_info(url, download=False)
+    with _youtube_dl(ytdlp_opts()) as ydl:
+        info_dict = _youtube_call(ydl.extract_info, url, download=False)
     data = {
         "video_url": info_dict.get("url", None),
         "video_id": info_dict.get("id", None),
@@ -191,12 +424,29 @@ def get_metadata_ytdlp(url: str):
     }
     return data
 
-def get_youtube_link(search: str, tolerance_sec: int, max_results: int, metadata: dict): # TODO: Cache Youtube_Search Query
-    # Variables
-    length_ms = metadata["duration_ms"]
-    target_seconds = length_ms // 1000
+YOUTUBE_SEARCH_TTL = 7 * DAY
+YOUTUBE_SEARCH_NEGATIVE_TTL = 1 * DAY
+YOUTUBE_URL_TTL = 90 * DAY
 
-    def do_search(query_type, search_for):
+SEARCH_MODE = "fallback"  # or "scored", set by --search-mode
+
+def youtube_video_id(url: str):
+    """Video id of a watch/youtu.be URL, a bare id is returned as is."""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.netloc.endswith("youtu.be"):
+        return parsed.path.lstrip("/")
+    if parsed.netloc:
+        return urllib.parse.parse_qs(parsed.query).get("v", [None])[0]
+    return url
+
+_search_local = threading.local()
+
+def _search_ydl(query_type: str):
+    """One warm YoutubeDL per thread and query type instead of one per search."""
+    instances = getattr(_search_local, "instances", None)
+    if instances is None:
+        instances = _search_local.instances = {}
+    if query_type not in instances:
         ydl_opts = {
             # "match_filter": lambda info_dict: (
             #     None
@@ -214,13 +464,92 @@ def get_youtube_link(search: str, tolerance_sec: int, max_results: int, metadata
             'noplaylist': True,
             'default_search': query_type
         }
-        with YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(f"{query_type}{max_results}:{search_for}", download=False)
-                return info.get("entries", []) if info else []
-            except Exception as e:
-                logging.debug("Search failed for (%s): %s", query_type, str(e))
-                return []
+        instances[query_type] = _youtube_dl({**ytdlp_opts(), **ydl_opts})
+    return instances[query_type]
+
+def search_youtube(query_type: str, search_for: str, max_results: int):
+    """Run one youtube search, entries are cached per query string."""
+    query = f"{query_type}{max_results}:{search_for}"
+    hit, entries = CACHE.get("youtube_search", query, YOUTUBE_SEARCH_TTL, YOUTUBE_SEARCH_NEGATIVE_TTL)
+    if not hit:
+        try:
+            metrics.add("search_queries")
+            info = _youtube_call(_search_ydl(query_type).extract_info, query, download=False)
+        except Exception as e:
+            logging.debug("Search failed for (%s): %s", query_type, str(e))
+            if _youtube_throttled(e):
+                LIMITER.penalize("youtube")
+            return [] # errors are not cached
+        entries = [
+            {
+                "id": entry.get("id"),
+                "webpage_url": entry.get("webpage_url"),
+                "duration": entry.get("duration"),
+                "uploader": entry.get("uploader"),
+                "title": entry.get("title"),
+            }
+            for entry in (info.get("entries", []) if info else [])
+            if entry
+        ]
+        CACHE.set("youtube_search", query, entries or None)
+    else:
+        logging.debug("Youtube search cache hit for (%s)", query)
+    # Skip videos that were marked as bad matches
+    return [
+        entry for entry in entries or []
+        if not CACHE.get("youtube_bad", str(entry["id"]), YOUTUBE_URL_TTL)[0]
+    ]
+
+def _resolved_key(metadata: dict):
+    """Cache key of a resolved track: recording id / ISRC / Spotify URI, else release id + title."""
+    for field in ("recording_id", "isrc", "spotify_uri"):
+        if metadata.get(field):
+            return metadata[field]
+    if metadata.get("release_id"):
+        return cache_key(metadata["release_id"], metadata.get("title") or "")
+    return None
+
+def forget_youtube_url(url: str):
+    """Invalidate a bad match: block the video and drop every track pinned to it."""
+    video_id = youtube_video_id(url)
+    if not video_id:
+        logging.error("Can't read a video id from (%s)", url)
+        return 0
+    CACHE.set("youtube_bad", video_id, True)
+    forgotten = 0
+    for key, resolved_url in CACHE.scan("youtube_url"):
+        if youtube_video_id(resolved_url) == video_id:
+            forgotten += CACHE.delete("youtube_url", key)
+    logging.info("Blocked video '%s', forgot %d resolved track(s)", video_id, forgotten)
+    return forgotten
+
+def get_youtube_link(search: str, tolerance_sec: int, max_results: int, metadata: dict):
+    """(url, matched_duration) of the best video, only matches are cached."""
+    # Tracks resolved before skip the search entirely
+    key = _resolved_key(metadata)
+    if key:
+        hit, url = CACHE.get("youtube_url", key, YOUTUBE_URL_TTL)
+        if hit and url:
+            logging.debug("Youtube_URL cache hit for '%s'", search)
+            metrics.put("fallback_depth", 0)
+            return url, True
+    if SEARCH_MODE == "scored":
+        url, good_match = _score_youtube_link(search, tolerance_sec, max_results, metadata)
+    else:
+        url, good_match = _search_youtube_link(search, tolerance_sec, max_results, metadata)
+    # Only pin real duration matches, never the last resort guess
+    if key and url and good_match:
+        CACHE.set("youtube_url", key, url)
+    return url, good_match
+
+def _search_youtube_link(search: str, tolerance_sec: int, max_results: int, metadata: dict):
+    """Fallback chain of searches, returns (url, matched_duration)."""
+    # Variables
+    length_ms = metadata["duration_ms"]
+    target_seconds = length_ms // 1000
+
+    def do_search(query_type, search_for):
+        return search_youtube(query_type, search_for, max_results)
 
     # TODO: Youtube Music Search
     # # --- 1. Try YouTube Music ---
@@ -236,13 +565,15 @@ def get_youtube_link(search: str, tolerance_sec: int, max_results: int, metadata
     # )
 
     #  --- 2. Fallback to YouTube Search---
-    for entry in do_search("ytsearch", search):
+    plain_entries = do_search("ytsearch", search)
+    for entry in plain_entries:
         if entry.get("duration") is None:
             continue
         yt_duration = entry["duration"]
         if abs(yt_duration - target_seconds) <= tolerance_sec:
             logging.debug("returning good youtube url")
-            return entry["webpage_url"]
+            metrics.put("fallback_depth", 1)
+            return entry["webpage_url"], True
     logging.warning(
         "Youtube Search failed, falling back to YouTube Topic Search for '%s'",
         search
@@ -255,7 +586,8 @@ def get_youtube_link(search: str, tolerance_sec: int, max_results: int, metadata
         yt_duration = entry["duration"]
         if abs(yt_duration - target_seconds) <= tolerance_sec:
             logging.debug("returning good youtube url")
-            return entry["webpage_url"]
+            metrics.put("fallback_depth", 2)
+            return entry["webpage_url"], True
     logging.warning(
         "Youtube Topic Search failed, falling back to Youtube Lyrics Video for '%s'",
         search
@@ -268,109 +600,242 @@ def get_youtube_link(search: str, tolerance_sec: int, max_results: int, metadata
         yt_duration = entry["duration"]
         if abs(yt_duration - target_seconds) <= tolerance_sec:
             logging.debug("returning good youtube url")
-            return entry["webpage_url"]
+            metrics.put("fallback_depth", 3)
+            return entry["webpage_url"], True
     logging.critical(
         "Youtube Lyrics Video not found, falling back to first best result for '%s'",
         search
     )
 
-    # --- 5. As a last resort, return the first YouTube result ---
-    youtube_entries = do_search("ytsearch", search)
-    if youtube_entries:
-        return youtube_entries[0]["webpage_url"]
+    # --- 5. As a last resort, return the first YouTube result (of step 2) ---
+    if plain_entries:
+        metrics.put("fallback_depth", 4)
+        return plain_entries[0]["webpage_url"], False
 
     # --- Error ---
     logging.warning("No youtube_url found for: (%s)", search)
-    return None
+    return None, False
+
+# Query variants in the preference order of the fallback chain
+SEARCH_VARIANTS = ["{search}", "{search} topic", "{search} AND lyrics"]
+
+def _normalize_title(text: str):
+    return " ".join(re.sub(r"[^\w\s]", " ", (text or "").lower()).split())
+
+SEARCH_POOL_WORKERS = 8
+_search_pool = None
+_search_pool_lock = threading.Lock()
+
+def _search_executor():
+    """Shared pool of the scored mode's searches, created on first use.
+
+    Its threads outlive a call, so their _search_ydl instances stay warm.
+    """
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(max_workers=SEARCH_POOL_WORKERS, thread_name_prefix="search")
+        return _search_pool
+
+def _score_youtube_link(search: str, tolerance_sec: int, max_results: int, metadata: dict):
+    """All variant searches at once, every candidate scored in one pass.
+
+    Score = closeness to the MusicBrainz duration, a Topic uploader and title
+    similarity. Duration matches always win, ties go to the fallback chain's
+    order (variant, then rank). Returns (url, matched_duration).
+    """
+    target_seconds = metadata["duration_ms"] // 1000
+    wanted_title = _normalize_title(f"{metadata.get('title')} {metadata.get('artist')}")
+    queries = [variant.format(search=search) for variant in SEARCH_VARIANTS]
+    results = list(_search_executor().map(metrics.bound(lambda q: search_youtube("ytsearch", q, max_results)), queries))
+
+    candidates = {}
+    for variant_rank, entries in enumerate(results):
+        for position, entry in enumerate(entries):
+            if entry["id"] in candidates: # same video from another variant
+                continue
+            candidates[entry["id"]] = (variant_rank, position, entry)
+    if not candidates:
+        logging.warning("No youtube_url found for: (%s)", search)
+        return None, False
+
+    def score(candidate):
+        variant_rank, position, entry = candidate
+        duration = entry.get("duration")
+        matched = duration is not None and abs(duration - target_seconds) <= tolerance_sec
+        if duration is None or not target_seconds:
+            closeness = 0.0
+        else:
+            closeness = max(0.0, 1 - abs(duration - target_seconds) / (tolerance_sec * 10 or 1))
+        topic = 1.0 if (entry.get("uploader") or "").endswith(" - Topic") else 0.0
+        similarity = difflib.SequenceMatcher(None, _normalize_title(entry.get("title")), wanted_title).ratio()
+        total = 0.5 * closeness + 0.2 * topic + 0.3 * similarity
+        return (matched, round(total, 2), -variant_rank, -position)
+
+    best = max(candidates.values(), key=score)
+    matched = score(best)[0]
+    # Same scale as the fallback chain: variant 1-3, 4 = no duration match
+    metrics.put("fallback_depth", best[0] + 1 if matched else 4)
+    if matched:
+        logging.debug("returning good youtube url (score %s)", score(best)[1])
+    else:
+        logging.critical("No duration match for '%s', falling back to best scored result", search)
+    return best[2]["webpage_url"], matched
 
 def get_metadata_spotify(track_url):
-    track = sp.track(track_url)
-
-    # Get artist details
-    artist_id = track["artists"][0]["id"]
-    artist_data = sp.artist(artist_id)
-
-    json_metadata = {
-        "title": track["name"],
-        "artist": track["artists"][0]["name"],
-        "album": track["album"]["name"],
-        "date": track["album"]["release_date"][:4],
-        "cover_url": track["album"]["images"][0]["url"],
-        "genres": artist_data.get("genres", [])
-    }
+    """Metadata of one Spotify track URL/URI, None if it can't be resolved.
+
+    Playlists and batches should go through src.spotify.resolve_lines, it
+    fetches 50 tracks (and their artists) per call.
+    """
+    import requests
+
+    parsed = parse_spotify(track_url)
+    if parsed is None or parsed[0] != "track":
+        logging.error("Not a Spotify track: '%s'", track_url)
+        return None
+    try:
+        json_metadata = SPOTIFY.resolve_ids([parsed[1]])[0]
+    except (SpotifyError, requests.RequestException) as e:
+        logging.error("Spotify lookup failed for '%s': %s", track_url, str(e))
+        return None
     logging.debug("return metadata")
     return json_metadata
 
-def embed_metadata(wav_file, output_file, cover_path, data):
-    MAX_COVER_SIZE = 1024
+MAX_COVER_SIZE = 1024
+COVER_TTL = 90 * DAY
+COVER_NEGATIVE_TTL = 7 * DAY
+
+def _thumbnail_jpeg(cover_data: bytes):
+    Image = _timed_import("PIL.Image")
+    img = Image.open(io.BytesIO(cover_data)).convert("RGB")
+    img.thumbnail((MAX_COVER_SIZE, MAX_COVER_SIZE))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+def _fetch_cover(url: str):
+    """Download + thumbnail one cover URL.
+
+    Returns JPEG bytes, None for a definite miss (404, not an image) and raises
+    on network trouble, so only definite misses end up negative cached.
+    """
+    response = http_get(url, priority=LOW)
+    if response.status_code == 404:
+        logging.debug("cover 404: %s", url)
+        return None
+    response.raise_for_status()
+    try:
+        return _thumbnail_jpeg(response.content)
+    except Exception as e:
+        logging.debug("cover data: %s", str(e))
+        return None
+
+def get_cover_jpeg(data: dict):
+    """Thumbnailed cover JPEG of a track, shared by every track of the same release.
+
+    Cached by release id for MusicBrainz covers and by URL for overrides,
+    including negative results. Returns None if there is no usable cover.
+    """
+    import requests
+
     if data["cover_url"] == "https://None":
-        cover_data = ""
+        return None
+    release_cover = data.get("release_id") and data["cover_url"].endswith(f"/release/{data['release_id']}/front")
+    key = f"release:{data['release_id']}" if release_cover else f"url:{data['cover_url']}"
+    hit, cover_jpeg = CACHE.get("cover", key, COVER_TTL, COVER_NEGATIVE_TTL)
+    if hit:
+        logging.debug("cover cache hit for '%s'", key)
+        return cover_jpeg
+
+    try:
+        cover_jpeg = _fetch_cover(data["cover_url"])
+        if cover_jpeg is None and data.get("cover_url_fallback"):
+            logging.warning("Invalid Cover Data falling back secondary cover")
+            # TODO: Add another API as fallback instead of other url
+            cover_jpeg = _fetch_cover(data["cover_url_fallback"])
+    except requests.RequestException as e:
+        logging.warning("Couldn't fetch cover (%s): %s", data["cover_url"], str(e))
+        return None # not cached, might work next time
+    CACHE.set("cover", key, cover_jpeg)
+    return cover_jpeg
+
+def write_cover(cover_path, data):
+    """Write the (thumbnailed) cover of a track as JPEG, decoy image if there is none."""
+    cover_jpeg = get_cover_jpeg(data)
+    if cover_jpeg is None:
+        if data["cover_url"] == "https://None":
+            logging.critical("No Real Cover, using decoy jpg")
+        else:
+            logging.critical("Invalid Cover Data Creating decoy JPG to download and go on")
+        Image = _timed_import("PIL.Image")
         img = Image.new("RGB", (1, 1), (255, 255, 255))
         img.save(cover_path, "JPEG")
-        logging.critical("No Real Cover, using decoy jpg")
-    else:
-        cover_data = requests.get(data["cover_url"]).content
-        try:
-            img = Image.open(io.BytesIO(cover_data)).convert("RGB")
-            # with open(cover_path, "wb") as f:
-            #     f.write(cover_data)
-            img.thumbnail((MAX_COVER_SIZE, MAX_COVER_SIZE))
-            img.save(cover_path, format="JPEG", quality=80)
-            logging.debug("wrote cover.jpg natively")
-        except Exception as e:
-            logging.debug("cover data: %s", str(e))
-            logging.warning("Invalid Cover Data falling back secondary cover")
-            cover_data = requests.get(data["cover_url_fallback"]).content
-            try: # TODO: Add another API as fallback instead of other url
-                img = Image.open(io.BytesIO(cover_data)).convert("RGB")
-                #with open(cover_path, "wb") as f:
-                #    f.write(cover_data)
-                img.thumbnail((MAX_COVER_SIZE, MAX_COVER_SIZE))
-                img.save(cover_path, format="JPEG", quality=80)
-                logging.debug("wrote cover.jpg natively though had to use fallback")
-            except Exception as e2:
-                logging.debug("cover data: %s", str(e2))
-                logging.critical("Invalid Cover Data Creating decoy JPG to download and go on")
-                img = Image.new("RGB", (1, 1), (255, 255, 255))
-                img.save(cover_path, "JPEG")
-                logging.debug("wrote cover.jpg using decoy file")
+        logging.debug("wrote cover.jpg using decoy file")
+        return
+    with open(cover_path, "wb") as f:
+        f.write(cover_jpeg)
+    logging.debug("wrote cover.jpg natively")
 
+IDENTITY_TAGS = [
+    ("MUSICBRAINZ_TRACKID", "recording_id"),
+    ("ISRC", "isrc"),
+    ("SPOTIFY_URI", "spotify_uri"),
+    ("YOUTUBE_ID", "youtube_id"),
+]
+
+def _metadata_args(data):
     genre_str = ", ".join(data["genres"])
+    return [
+        "-metadata", f"title={data['title']}",
+        "-metadata", f"artist={data['artist']}",
+        "-metadata", f"album={data['album']}",
+        "-metadata", f"date={data['date']}",
+        "-metadata", f"genre={genre_str}",
+        # Identity tags, the same keys the done index uses
+        *[
+            arg
+            for tag, field in IDENTITY_TAGS
+            if data.get(field)
+            for arg in ("-metadata", f"{tag}={data[field]}")
+        ],
+    ]
+
+def embed_metadata(audio_file, output_file, cover_path, data, tags: dict = None):
+    write_cover(cover_path, data)
 
     CODEC: str = output_file.rsplit(".", 1)[-1]
     if CODEC == "opus":
         cmd = [ # TODO: Natively support libopus
-            "ffmpeg",
-            "-i", wav_file,
+            "ffmpeg", "-y",
+            "-i", audio_file,
             "-map", "0:a", 
-            "-metadata", f"title={data['title']}",
-            "-metadata", f"artist={data['artist']}",
-            "-metadata", f"album={data['album']}",
-            "-metadata", f"date={data['date']}",
-            "-metadata", f"genre={genre_str}",
+            *_metadata_args(data),
+            *_tag_args(tags),
             "-metadata", cover_path,
             "-c:a", "libopus", "-b:a", "128k",
             output_file
         ]
     else:
         cmd = [
-            "ffmpeg", 
-            "-i", wav_file, # input file
+            "ffmpeg", "-y",
+            "-i", audio_file, # input file
             "-i", cover_path, #cover
             "-map", "0", "-map", "1",
-            #"-acodec", "flac",
+            # normalize already wrote FLAC, just add tags + cover
+            *(["-c:a", "copy"] if audio_file.endswith(".flac") else []),
             #"-compression_level", "8",
-            "-metadata", f"title={data['title']}",
-            "-metadata", f"artist={data['artist']}",
-            "-metadata", f"album={data['album']}",
-            "-metadata", f"date={data['date']}",
-            "-metadata", f"genre={genre_str}",
+            *_metadata_args(data),
+            *_tag_args(tags),
             "-disposition:v", "attached_pic",
             output_file
         ]
     logging.debug("embedding metadata")
-    subprocess.run(cmd, check=False)
+    if metrics.run(cmd, check=False).returncode != 0:
+        logging.error("ffmpeg failed to write '%s'", output_file)
+        return 1
     logging.debug("embedding metadata done")
+    return 0
 
 def compress_audio(file: dict, output_path: str):
     if os.path.exists(file["path"]):
@@ -380,13 +845,128 @@ def compress_audio(file: dict, output_path: str):
     else:
         logging.error("'%s' doesn't exist: skipping compression", file["path"])
         return 1
+    # VBR profiles (e.g. mp3 V2) give a quality instead of a bitrate
+    rate = ["-q:a", file["quality"]] if file.get("quality") else ["-b:a", file["bitrate"]]
     cmd = [
-        "ffmpeg",
+        "ffmpeg", "-y",
         "-i", file["path"],
-        "-c:a", file["codec"], "-b:a", file["bitrate"],
+        "-c:a", file["codec"], *rate,
+        *file.get("args", []),
         output_path
     ]
-    subprocess.run(cmd, check=False)
+    if metrics.run(cmd, check=False).returncode != 0:
+        logging.error("ffmpeg failed to write '%s'", output_path)
+        return 1
+    return 0
+
+# Containers the downloaded codecs go into without decoding (--passthrough)
+PASSTHROUGH_CONTAINERS = {"opus": "opus", "aac": "m4a", "vorbis": "ogg", "mp3": "mp3"}
+# Reference loudness of the gain tags, players apply the gain at playback
+REPLAYGAIN_REFERENCE = -18.0  # ReplayGain 2.0, LUFS
+R128_REFERENCE = -23.0        # EBU R128, what Opus players use
+
+def _tag_args(tags: dict = None):
+    return [arg for tag, value in (tags or {}).items() for arg in ("-metadata", f"{tag}={value}")]
+
+def gain_tags(measure_value: dict, codec: str):
+    """ReplayGain tags (R128 for Opus) from a loudnorm measurement, {} for silence."""
+    loudness = float(measure_value["input_i"])
+    peak = 10 ** (float(measure_value["input_tp"]) / 20)
+    if not math.isfinite(loudness):
+        return {}
+    if codec == "opus":
+        # Q7.8 fixed point dB (RFC 7845), Opus players ignore REPLAYGAIN_*
+        return {"R128_TRACK_GAIN": str(max(-32768, min(32767, round((R128_REFERENCE - loudness) * 256))))}
+    return {
+        "REPLAYGAIN_TRACK_GAIN": f"{REPLAYGAIN_REFERENCE - loudness:.2f} dB",
+        "REPLAYGAIN_TRACK_PEAK": f"{peak:.6f}",
+    }
+
+def audio_codec(file):
+    """Codec of the first audio stream of file, None if ffprobe can't tell."""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=codec_name", "-of", "csv=p=0", file]
+    try:
+        result = metrics.run(cmd, stdout=subprocess.PIPE, text=True)
+    except FileNotFoundError:
+        logging.warning("ffprobe not found, can't pass the audio through")
+        return None
+    return (result.stdout.strip() or None) if result.returncode == 0 else None
+
+def remux_audio(file, output_path, cover_path, data, tags: dict):
+    """Copy the audio stream of file into output_path as is, tags + cover added (no decode/encode)."""
+    if os.path.exists(output_path):
+        logging.info("Overwriting: '%s'", output_path)
+        os.remove(output_path)
+
+    def build(with_cover: bool):
+        cover = ["-i", cover_path] if with_cover else []
+        cover_maps = ["-map", "1", "-c:v", "copy", "-disposition:v", "attached_pic"] if with_cover else []
+        return [
+            "ffmpeg", "-y",
+            "-i", file, *cover,
+            "-map", "0:a", *cover_maps,
+            "-c:a", "copy",
+            *_metadata_args(data),
+            *_tag_args(tags),
+            # mp4 drops tags it doesn't know (the gain tags) without it
+            *(["-movflags", "use_metadata_tags"] if output_path.endswith(".m4a") else []),
+            output_path
+        ]
+
+    logging.debug("remuxing '%s'", output_path)
+    if metrics.run(build(True), check=False).returncode == 0:
+        return 0
+    # Older ffmpeg builds can't put cover art into ogg/opus
+    logging.warning("Remux failed, retrying without cover in '%s'", output_path)
+    Path(output_path).unlink(missing_ok=True)
+    if metrics.run(build(False), check=False).returncode != 0:
+        logging.error("ffmpeg failed to write '%s'", output_path)
+        return 1
+    return 0
+
+def fused_audio(file, output_file, compressed_file, cover_path, data, measure_value, final_file: dict):
+    """Normalize once and write the tagged FLAC + compressed file in one ffmpeg run.
+
+    Replaces normalize_audio -> embed_metadata -> compress_audio: one decode,
+    loudnorm split into both encoders, no WAV or FLAC re-read in between.
+    loudnorm works at 192kHz internally, outputs are resampled to 48kHz.
+    """
+    write_cover(cover_path, data)
+    if os.path.exists(compressed_file):
+        logging.info("Overwriting: '%s'", compressed_file)
+        os.remove(compressed_file)
+
+    def build(cover_in_compressed: bool):
+        compressed_maps = ["-map", "[compressed]"]
+        if cover_in_compressed:
+            compressed_maps += ["-map", "1", "-c:v", "copy", "-disposition:v", "attached_pic"]
+        return [
+            "ffmpeg", "-y",
+            "-i", file,
+            "-i", cover_path,
+            "-filter_complex",
+            f"[0:a]{_loudnorm_filter(measure_value)},aresample=48000,asplit=2[lossless][compressed]",
+            # Lossless output
+            "-map", "[lossless]", "-map", "1",
+            "-c:a", "flac", "-c:v", "copy",
+            *_metadata_args(data),
+            "-disposition:v", "attached_pic",
+            output_file,
+            # Compressed output
+            *compressed_maps,
+            "-c:a", final_file["codec"], "-b:a", final_file["bitrate"],
+            *_metadata_args(data),
+            compressed_file
+        ]
+
+    logging.debug("running fused normalize/embed/compress")
+    if metrics.run(build(True), check=False).returncode != 0:
+        # Older ffmpeg builds can't put cover art into ogg/opus
+        logging.warning("Fused run failed, retrying without cover in '%s'", compressed_file)
+        if metrics.run(build(False), check=False).returncode != 0:
+            logging.error("ffmpeg failed to write '%s'", output_file)
+            return 1
+    logging.debug("fused run done")
     return 0
 
 def check_filepaths(file_path: str, compression_arg: bool):
@@ -397,15 +977,807 @@ def check_filepaths(file_path: str, compression_arg: bool):
     else:
         return 0
 
+
+# Secondary Variables
+TOLERANCE_SEC = 2
+MAX_RESULTS_YTSEARCH = 10
+COMPRESSION_OPT_PATH = "output/compressed (ohio-impressed)"
+SCRATCH_DIR = "output"  # default root of the per job tmp dirs, see --scratch
+
+def new_job(song: str, youtube: str = "", cover: str = "", options: dict = None, track: dict = None):
+    """Create the job dict that is handed from stage to stage.
+
+    options holds the per-run switches (e.g. {"fused": True}), it travels with
+    the job so process pool workers see the same settings. track is a record
+    of a tracks.jsonl manifest (metadata taken from the Exportify CSV).
+    """
+    return {
+        "id": job_id(song, youtube, cover),
+        "song": song or youtube,
+        "options": dict(options or {}),
+        "track": track,
+        "input": song,
+        "youtube": youtube,
+        "cover": cover,
+        "status": "pending",  # pending -> done | exists | failed
+        "error": None,
+        "completed": [],  # stages finished so far, used to resume
+        "attempts": 1,
+        "path": None,
+        "compressed": None,
+        "skip_download": False,
+        "youtube_matched": True,  # False for a search's last resort guess, whose video id says nothing
+        "fused": False,
+        "metadata": None,
+        "song_data": None,
+        "scratch": None,
+        "loudness": None,  # loudnorm measurement, kept for the gain tags of --passthrough
+        "metrics": metrics.new_record(),
+    }
+
+def _fail(job: dict, error: str):
+    job["status"] = "failed"
+    job["error"] = error
+    return job
+
+def _set_paths(job: dict, filename: str):
+    job["path"] = f"output/{filename}.flac"
+    job["compressed"] = f"{COMPRESSION_OPT_PATH}/{filename}.{FINAL_FILE['container']}"
+
+FINAL_FILE = {
+    "compress": True,
+    "codec": "libopus",
+    "container": "opus",
+    "bitrate": "128k"
+}
+
+# Output profiles of --transcode, same shape as FINAL_FILE
+TRANSCODE_PROFILES = {
+    "opus128": {"codec": "libopus", "container": "opus", "bitrate": "128k"},
+    "mp3v2": {"codec": "libmp3lame", "container": "mp3", "quality": "2"},
+    # mp4 would re-encode the cover into a video stream otherwise
+    "aac": {"codec": "aac", "container": "m4a", "bitrate": "256k", "args": ["-c:v", "copy", "-disposition:v", "attached_pic"]},
+}
+TRANSCODE_PATH = "output/transcoded"
+
+# Fields a tracks.jsonl record can fill, its values win over MusicBrainz
+TRACK_METADATA_FIELDS = ["title", "artist", "album", "date", "duration_ms", "genres", "cover_url", "isrc", "spotify_uri"]
+
+def metadata_from_track(track: dict, metadata: dict = None):
+    """Metadata dict from a tracks.jsonl record, MusicBrainz metadata fills the gaps.
+
+    The CSV duration is exact, so it is the one get_youtube_link checks against.
+    """
+    merged = dict(metadata or {
+        "release_id": None, "album": "", "date": "", "cover_url": "https://None", "genres": [], "duration_ms": 0
+    })
+    for field in TRACK_METADATA_FIELDS:
+        if track.get(field):
+            merged[field] = track[field]
+    return merged
+
+def _identity_keys(job: dict):
+    """Keys of the done index this job is known by so far."""
+    metadata = job["metadata"] or {}
+    keys = {field: metadata.get(field) for _, field in IDENTITY_TAGS}
+    keys["input"] = cache_key(job["input"]) if job["input"] else None
+    if not job.get("youtube_matched", True):
+        # A guessed video may be another recording, it must not stand for this one
+        keys["youtube_id"] = None
+    return keys
+
+def _check_done(job: dict):
+    """Skip a job whose recording was produced before, whatever its filename was."""
+    done = DONE.lookup(_identity_keys(job))
+    if done is None:
+        return False
+    job["path"] = done["path"]
+    job["compressed"] = done["compressed"] or job["compressed"]
+    if job["compressed"] and os.path.exists(job["compressed"]):
+        logging.info("Already produced as '%s' (same %s): skipping\n", done["path"], done["key_type"])
+        job["status"] = "exists"
+    else:
+        logging.info("Already produced as '%s' (same %s): skipping to compression", done["path"], done["key_type"])
+        job["skip_download"] = True
+    if job["compressed"] is None:
+        job["compressed"] = f"{COMPRESSION_OPT_PATH}/{Path(done['path']).stem}.{FINAL_FILE['container']}"
+    return True
+
+def _input_paths(song: str):
+    """(flac, compressed) paths named after the input text, what the metadata lookup usually ends up with."""
+    names = sanitize_filename(song)
+    filename = f"{names['title']} - {names['artist']}"
+    return f"output/{filename}.flac", f"{COMPRESSION_OPT_PATH}/{filename}.{FINAL_FILE['container']}"
+
+def _outputs_exist(path: str, compressed: str):
+    return os.path.exists(path) and (not FINAL_FILE["compress"] or bool(compressed) and os.path.exists(compressed))
+
+def already_done(song: str):
+    """Path of song's FLAC if it's fully produced already, else None.
+
+    Only looks at the done index (by input text) and the files named after the
+    input text: no metadata lookup, no network and none of the heavy imports.
+    """
+    done = DONE.lookup({"input": cache_key(song)}) if os.path.exists(DONE.path) else None
+    if done is not None and _outputs_exist(done["path"], done["compressed"]):
+        return done["path"]
+    path, compressed = _input_paths(song)
+    return path if _outputs_exist(path, compressed) else None
+
+def stage_metadata(job: dict):
+    """Resolve metadata + output filenames, flags tracks that already exist."""
+    if job["status"] != "pending":
+        return job
+    song, youtube = job["input"], job["youtube"]
+
+    # Validate Important Args
+    if not song and not youtube:
+        logging.error("No Song name or Youtube URL\n")
+        return _fail(job, "no song name or youtube url")
+    if not song:
+        logging.info("... Processing: (%s)", youtube)
+        # TODO: Derive song from youtube url
+        logging.error("No Song name given, can't derive metadata from (%s)\n", youtube)
+        return _fail(job, "no song name given")
+
+    if youtube:
+        logging.info("... Processing: '%s' (%s) ---", song, youtube)
+        logging.info("Youtube_URL is: (%s)", youtube)
+    else:
+        logging.info("... Processing: '%s'", song)
+    job["song_data"] = sanitize_filename(song)
+    # Same input text as an earlier track, not even a metadata lookup needed
+    if _check_done(job):
+        return job
+    path, compressed = _input_paths(song)
+    if _outputs_exist(path, compressed):
+        # Named after the input text already, no need to ask MusicBrainz for the name
+        job["path"], job["compressed"] = path, compressed
+        logging.info("File '%s' already exists: skipping\n", path)
+        job["status"] = "exists"
+        return job
+    track = job.get("track")
+    if track and track.get("complete"):
+        # Everything is in the CSV/Spotify record already, no MusicBrainz round-trip
+        logging.info("Using CSV/Spotify metadata for '%s'", song)
+        METADATA = metadata_from_track(track)
+    else:
+        if track and track.get("title") and track.get("artist"):
+            lookup = sanitize_filename(f"{track['title']} - {track['artist']}")
+        else:
+            lookup = job["song_data"]
+        METADATA = get_metadata_musicbrainz(lookup['title'], lookup['artist'])
+        if track and (METADATA is not None or track.get("duration_ms")):
+            METADATA = metadata_from_track(track, METADATA)
+    if METADATA is None:
+        logging.error("No MusicBrainz result for '%s'\n", song)
+        return _fail(job, "no musicbrainz result")
+    filename_data = sanitize_filename(f"{METADATA['title']} - {METADATA['artist']}")
+    _set_paths(job, f"{filename_data['title']} - {filename_data['artist']}")
+
+    # smaller optional args
+    if job["cover"]:
+        logging.info("Cover_URL is: (%s)", job["cover"])
+        METADATA['cover_url'] = job["cover"]
+    job["metadata"] = METADATA
+    if _check_done(job):
+        return job
+
+    match check_filepaths(job["path"], FINAL_FILE["compress"]):
+        case 1: # All files already there
+            logging.info("File '%s' already exists & compression deactivated: closing\n", job["path"])
+            job["status"] = "exists"
+        case 2: # Skipping to compression
+            logging.info("File '%s' already exists & compression activated: skipping to compression", job["path"])
+            job["skip_download"] = True
+    return job
+
+def stage_search(job: dict):
+    """Find a Youtube_URL for the track unless one was given."""
+    if job["status"] != "pending" or job["skip_download"] or job["youtube"]:
+        return job
+    QUERY = os.path.basename(job["path"])[:-len(".flac")]
+    youtube, matched = get_youtube_link(QUERY, TOLERANCE_SEC, MAX_RESULTS_YTSEARCH, job["metadata"])
+    if youtube is None:
+        # Fallback to user Input
+        USER_INPUT = f"{job['song_data']['title']} - {job['song_data']['artist']}"
+
+        # Redefining/Revalidating Things
+        QUERY = USER_INPUT
+        _set_paths(job, USER_INPUT)
+
+        # Running loop again
+        match check_filepaths(job["path"], FINAL_FILE["compress"]):
+            case 1: # All files already there
+                logging.info("File '%s' already exists & compression deactivated: closing\n", job["path"])
+                job["status"] = "exists"
+                return job
+            case 2: # Skipping to compression
+                logging.info("File '%s' already exists & compression activated: skipping to compression", job["path"])
+                job["skip_download"] = True
+                return job
+            case 0: # No initial file there, downloading audio
+                logging.critical("Fetching Youtube_URL failed, falling back to user input query: '%s'", QUERY)
+                youtube, matched = get_youtube_link(QUERY, TOLERANCE_SEC, MAX_RESULTS_YTSEARCH, job["metadata"])
+                if youtube is None:
+                    logging.error("Fetching Youtube_URL failed for all Queries\n")
+                    return _fail(job, "no youtube url found")
+    logging.info("No Youtube_URL given, generated one is: (%s)", youtube)
+    job["youtube"] = youtube
+    job["youtube_matched"] = bool(matched)
+    return job
+
+def _scratch_files(job: dict):
+    """Per job tmp files, so parallel tracks never step on each other.
+
+    They live under --scratch (default output/), a tmpfs keeps them off slow disks.
+    """
+    Path("output").mkdir(exist_ok=True) # the finished files go there in any case
+    if job["scratch"] is None:
+        root = job["options"].get("scratch") or SCRATCH_DIR
+        Path(root).mkdir(parents=True, exist_ok=True)
+        if job["options"].get("manifest"):
+            # Fixed per job, so a later run finds what this one downloaded
+            job["scratch"] = os.path.join(root, f"tmp_{job['id']}")
+        else:
+            job["scratch"] = tempfile.mkdtemp(prefix="tmp_", dir=root)
+    Path(job["scratch"]).mkdir(parents=True, exist_ok=True)
+    return scratch_paths(job["scratch"])
+
+def scratch_paths(scratch: str):
+    return {
+        # whatever container bestaudio is, ffmpeg probes it
+        "downloaded": os.path.join(scratch, "tmp_downloaded.audio"),
+        # FLAC at 48kHz instead of a PCM WAV, embed only adds tags to it
+        "normalized": os.path.join(scratch, "tmp_normalized.flac"),
+        "cover": os.path.join(scratch, "tmp_cover_data.jpg"),
+    }
+
+def stage_download(job: dict):
+    if job["status"] != "pending" or job["skip_download"]:
+        return job
+    # Same video as an already produced track
+    job["metadata"]["youtube_id"] = youtube_video_id(job["youtube"])
+    if _check_done(job):
+        return job
+    tmp = _scratch_files(job)
+    if job["options"].get("stream"):
+        try:
+            measured = stream_audio(tmp["downloaded"], job["youtube"])
+        except Exception as e:
+            logging.warning("Streaming (%s) failed: %s, downloading it instead", job["youtube"], str(e))
+        else:
+            if measured is not None:
+                # normalize finds it by content hash, no second read for the analysis
+                LOUDNESS.set(content_hash(tmp["downloaded"]), LOUDNORM_TARGET, measured, os.path.basename(job["path"]))
+            if os.path.exists(tmp["downloaded"]) and os.path.getsize(tmp["downloaded"]):
+                return job
+    if download_audio(tmp["downloaded"], job["youtube"]) != 0:
+        return _fail(job, "download failed")
+    return job
+
+def _drop_partial(job: dict, error: str, *paths):
+    """Fail the job and delete what a failed ffmpeg run left, a truncated file must not pass as produced."""
+    for path in paths:
+        Path(path).unlink(missing_ok=True)
+    return _fail(job, error)
+
+def stage_normalize(job: dict):
+    if job["status"] != "pending" or job["skip_download"]:
+        return job
+    tmp = _scratch_files(job)
+    measured = measure_loudness(tmp["downloaded"], LOUDNORM_TARGET, analyze_audio, os.path.basename(job["path"]))
+    if job["options"].get("passthrough"):
+        # Gain goes into tags, the samples stay as downloaded
+        job["loudness"] = measured
+        return job
+    if job["options"].get("fused"):
+        # One ffmpeg run for normalize, embed and compress
+        Path(COMPRESSION_OPT_PATH).mkdir(parents=True, exist_ok=True)
+        status = fused_audio(tmp["downloaded"], job["path"], job["compressed"], tmp["cover"], job["metadata"], measured, FINAL_FILE)
+        if status != 0:
+            return _drop_partial(job, "fused ffmpeg run failed", job["path"], job["compressed"])
+        job["fused"] = True
+        DONE.record(_identity_keys(job), job["path"], job["compressed"])
+        return job
+    normalize_audio(tmp["downloaded"], tmp["normalized"], measured)
+    return job
+
+def stage_embed(job: dict):
+    if job["status"] != "pending" or job["skip_download"] or job["fused"]:
+        return job
+    tmp = _scratch_files(job)
+    if job["options"].get("passthrough") and job.get("loudness"):
+        # FLAC of the downloaded audio without baked-in gain
+        status = embed_metadata(tmp["downloaded"], job["path"], tmp["cover"], job["metadata"], gain_tags(job["loudness"], "flac"))
+    else:
+        status = embed_metadata(tmp["normalized"], job["path"], tmp["cover"], job["metadata"])
+    if status != 0:
+        return _drop_partial(job, "embedding metadata failed", job["path"])
+    DONE.record(_identity_keys(job), job["path"])
+    return job
+
+def _passthrough(job: dict):
+    """Remux the downloaded stream as the compressed file, False if it has to be encoded after all."""
+    if not job["scratch"] or not job.get("loudness"):
+        return False # e.g. only the FLAC was left from an earlier run
+    tmp = scratch_paths(job["scratch"])
+    if not os.path.exists(tmp["downloaded"]):
+        return False
+    codec = audio_codec(tmp["downloaded"])
+    container = PASSTHROUGH_CONTAINERS.get(codec)
+    if container is None:
+        logging.info("Downloaded audio is '%s', encoding it instead of passing it through", codec)
+        return False
+    compressed = f"{os.path.splitext(job['compressed'])[0]}.{container}"
+    if remux_audio(tmp["downloaded"], compressed, tmp["cover"], job["metadata"], gain_tags(job["loudness"], codec)) != 0:
+        return False
+    job["compressed"] = compressed
+    return True
+
+def stage_compress(job: dict):
+    if job["status"] != "pending":
+        return job
+    if check_filepaths(job["path"], FINAL_FILE["compress"]) == 0:
+        logging.error("`%s` was never written\n", job["path"])
+        return _fail(job, "flac was never written")
+    if job["fused"]: # already written by the fused run
+        if not os.path.exists(job["compressed"]):
+            logging.error("`%s` was never written\n", job["compressed"])
+            return _fail(job, "compressed file was never written")
+    else:
+        Path(COMPRESSION_OPT_PATH).mkdir(parents=True, exist_ok=True)
+        if not (job["options"].get("passthrough") and _passthrough(job)):
+            if compress_audio({**FINAL_FILE, "path": job["path"]}, job["compressed"]) != 0:
+                return _drop_partial(job, "compression failed", job["compressed"])
+    # os.remove(job["path"]) # Delete large file
+    logging.info("✅ Compressed: '%s'", job["compressed"])
+    logging.info("✅ Downloaded: '%s'\n", job["path"])
+    DONE.record(_identity_keys(job), job["path"], job["compressed"])
+    job["status"] = "done"
+    return job
+
+def finish_job(job: dict):
+    """Delete the scratch dir of a job, unfinished jobs keep it when they can be resumed.
+
+    Unfinished includes still pending: an interrupted run gets here from run_job's finally.
+    """
+    if job["scratch"]:
+        if job["status"] not in ("done", "exists") and job["options"].get("manifest"):
+            logging.info("Keeping tmp files of '%s' to resume later", job["song"])
+        else:
+            logging.debug("removing temp files")
+            shutil.rmtree(job["scratch"], ignore_errors=True)
+            job["scratch"] = None
+    if job["options"].get("manifest"):
+        MANIFEST.save(job)
+    if job["options"].get("metrics"):
+        metrics.write(job, job["options"]["metrics"])
+    return job
+
+def worker_settings():
+    """What __main__ configured that pool processes need, see init_worker."""
+    return {
+        "cache": CACHE.enabled,
+        "loudness": LOUDNESS.enabled,
+        "search_mode": SEARCH_MODE,
+        "network": dict(NETWORK_SETTINGS),
+        "buckets": LIMITER.buckets,  # shared memory: the workers draw from the parent's buckets
+    }
+
+def init_worker(settings: dict):
+    """Pool process initializer, a no-op for forked workers.
+
+    Spawned ones (no fork on Windows) start from a fresh import of main.py.
+    """
+    global SEARCH_MODE
+    if not logging.getLogger().handlers:
+        setup_logging()
+    CACHE.enabled = settings["cache"]
+    LOUDNESS.enabled = settings["loudness"]
+    SEARCH_MODE = settings["search_mode"]
+    configure_network(**settings["network"])
+    LIMITER.buckets.update(settings["buckets"])
+
+# name, function, kind ('thread' for network, 'process' for ffmpeg), default workers
+STAGES = [
+    ("metadata", stage_metadata, "thread", 1),  # MusicBrainz allows ~1 req/s anyway
+    ("search", stage_search, "thread", 2),
+    ("download", stage_download, "thread", 4),
+    ("normalize", stage_normalize, "process", os.cpu_count() or 1),
+    ("embed", stage_embed, "process", os.cpu_count() or 1),
+    ("compress", stage_compress, "process", os.cpu_count() or 1),
+]
+STAGE_NAMES = [name for name, _, _, _ in STAGES]
+
+def _artifacts_ok(name: str, job: dict):
+    """Is what a completed stage produced still there?"""
+    scratch = job["scratch"] or ""
+    downloaded = scratch_paths(scratch)["downloaded"]
+    normalized = scratch_paths(scratch)["normalized"]
+    match name:
+        case "metadata":
+            return job["metadata"] is not None or job["status"] != "pending"
+        case "search":
+            return bool(job["youtube"]) or job["skip_download"] or job["status"] != "pending"
+        case "download":
+            return job["skip_download"] or (bool(scratch) and os.path.exists(downloaded))
+        case "normalize":
+            if job["options"].get("passthrough") and job.get("loudness"):
+                return bool(scratch) and os.path.exists(downloaded)
+            if job["fused"]:
+                return os.path.exists(job["path"]) and os.path.exists(job["compressed"])
+            return job["skip_download"] or (bool(scratch) and os.path.exists(normalized))
+        case "embed":
+            return job["skip_download"] or job["fused"] or os.path.exists(job["path"])
+        case "compress":
+            return job["status"] != "pending"
+    return False
+
+def _stage_outputs(name: str, job: dict):
+    """Scratch files a stage writes, dropped before it runs (again)."""
+    if not job["scratch"] or job["status"] != "pending" or job["skip_download"]:
+        return []
+    tmp = scratch_paths(job["scratch"])
+    return {"download": [tmp["downloaded"]], "normalize": [tmp["normalized"]]}.get(name, [])
+
+def run_stage(name: str, job: dict):
+    """Run one stage of a job, skip it if an earlier run already completed it."""
+    if name in job["completed"] and _artifacts_ok(name, job):
+        logging.debug("'%s': stage '%s' already done in an earlier run", job["song"], name)
+        return job
+    # Everything after a re-run stage has to run again too
+    job["completed"] = [done for done in job["completed"] if STAGE_NAMES.index(done) < STAGE_NAMES.index(name)]
+    for path in _stage_outputs(name, job):
+        # A half written one from a crashed attempt: yt-dlp would take it as finished
+        Path(path).unlink(missing_ok=True)
+    stage = STAGES[STAGE_NAMES.index(name)][1]
+    try:
+        with metrics.span(job, name), metrics.profiled(job["options"].get("profile"), f"{name}-{job['id']}"):
+            job = stage(job)
+    except Exception as e: # recorded, the rest of the run goes on
+        logging.exception("Stage '%s' crashed for '%s'", name, job["song"])
+        job = _fail(job, f"{name}: {e}")
+    if job["status"] != "failed":
+        job["completed"].append(name)
+    if job["options"].get("manifest"):
+        MANIFEST.save(job)
+    return job
+
+def resume_job(job: dict):
+    """Swap a new job for its saved state from an earlier run, if there is one."""
+    saved = MANIFEST.load(job["id"])
+    if saved is None:
+        return job
+    saved["options"] = job["options"]
+    if saved["status"] in ("done", "exists"):
+        logging.info("Already finished in an earlier run: '%s'", saved["song"])
+        return saved
+    logging.info(
+        "Resuming '%s' after stage '%s' (attempt %d)",
+        saved["song"], saved["completed"][-1] if saved["completed"] else "-", saved["attempts"] + 1
+    )
+    saved.update(status="pending", error=None, attempts=saved["attempts"] + 1)
+    return saved
+
+def prepare_jobs(lines, options: dict):
+    """Jobs for the lines of a batch, duplicates dropped, resumed if asked to."""
+    seen = set()
+    for line in lines:
+        if isinstance(line, dict): # tracks.jsonl record
+            line, track = line["song"], line
+        else:
+            track = None
+        job = new_job(line, options=options, track=track)
+        if job["id"] in seen:
+            logging.info("Skipping duplicate line: '%s'", line)
+            continue
+        seen.add(job["id"])
+        yield resume_job(job) if options.get("resume") else job
+
+def run_job(job: dict, cancelled=None):
+    """Run a job through every stage in order, cancelled() is checked between stages."""
+    try:
+        for name in STAGE_NAMES:
+            if cancelled is not None and cancelled() and job["status"] == "pending":
+                logging.info("'%s' cancelled before stage '%s'", job["song"], name)
+                job = _fail(job, "cancelled")
+                break
+            job = run_stage(name, job)
+    finally:
+        finish_job(job)
+    return job
+
+def process_track(song: str, youtube: str = "", cover: str = "", options: dict = None, track: dict = None):
+    """Run one track through the whole download chain, returns the finished job."""
+    job = new_job(song, youtube, cover, options, track)
+    if job["options"].get("resume"):
+        job = resume_job(job)
+    return run_job(job)
+
+def _valid_line(line):
+    """A batch line or a tracks.jsonl record, what prepare_jobs can take."""
+    if isinstance(line, dict):
+        return isinstance(line.get("song"), str) and bool(line["song"].strip())
+    return isinstance(line, str)
+
+def request_jobs(body: dict, options: dict):
+    """Jobs of a `serve` submission: one track, a Spotify track/playlist or the lines of a batch."""
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    for field in ("spotify", "song", "youtube", "cover"):
+        if not isinstance(body.get(field, ""), str):
+            raise ValueError(f"'{field}' has to be a string")
+    if body.get("lines"):
+        lines = body["lines"]
+        if not isinstance(lines, list) or not all(_valid_line(line) for line in lines):
+            raise ValueError("'lines' has to be a list of strings or track objects with a 'song' string")
+    elif body.get("spotify"):
+        lines = [body["spotify"]]
+    elif body.get("song"):
+        job = new_job(body["song"], body.get("youtube", ""), body.get("cover", ""), options)
+        return [resume_job(job) if options.get("resume") else job]
+    else:
+        raise ValueError("expected 'song', 'spotify' or 'lines'")
+    return list(prepare_jobs(resolve_lines(lines), options))
+
+def _transcode_file(source: str, target: str, profile: dict):
+    """Encode one FLAC (process pool worker), returns the source's content hash or None."""
+    Path(target).parent.mkdir(parents=True, exist_ok=True)
+    # Written next to the target and swapped in, a cancelled run never leaves half a file
+    partial_target = os.path.join(os.path.dirname(target), f".partial.{os.path.basename(target)}")
+    source_hash = content_hash(source)
+    if compress_audio({**profile, "path": source}, partial_target) != 0 or not os.path.exists(partial_target):
+        Path(partial_target).unlink(missing_ok=True)
+        return None
+    os.replace(partial_target, target)
+    return source_hash
+
+def transcode_library(library: str, profiles: list, output_dir: str = TRANSCODE_PATH, workers: int = None):
+    """Re-encode every FLAC below library into each profile, only what changed since the last run.
+
+    Targets mirror the library layout in output_dir/<profile>/. Returns the number of failures.
+    """
+    index = LibraryIndex(library)
+    index.refresh()
+    index.load()
+    sources = [
+        f["path"] for f in index.files
+        if f["path"].lower().endswith(".flac")
+        and not any(part.startswith("tmp_") for part in Path(f["path"]).parts) # scratch dirs
+    ]
+    todo = []
+    skipped = 0
+    for source in sources:
+        try:
+            stat = os.stat(source)
+        except OSError: # removed since the index refresh
+            continue
+        relative = os.path.splitext(os.path.relpath(source, index.root))[0]
+        for name in profiles:
+            profile = TRANSCODE_PROFILES[name]
+            target = os.path.join(output_dir, name, f"{relative}.{profile['container']}")
+            if TRANSCODES.is_current(source, name, profile, stat, target):
+                skipped += 1
+            else:
+                todo.append((source, name, profile, stat, target))
+    logging.info("Transcode: %d FLAC files, %d targets up to date, %d to encode", len(sources), skipped, len(todo))
+
+    failed = 0
+    with process_pool(workers or os.cpu_count() or 1, init_worker, (worker_settings(),)) as pool:
+        futures = {pool.submit(_transcode_file, source, target, profile): (source, name, profile, stat, target) for source, name, profile, stat, target in todo}
+        for done, future in enumerate(as_completed(futures), 1):
+            source, name, profile, stat, target = futures[future]
+            try:
+                source_hash = future.result()
+            except Exception as e:
+                logging.error("Transcode of '%s' (%s) crashed: %s", source, name, str(e))
+                source_hash = None
+            if source_hash is None:
+                failed += 1
+                logging.error("❌ [%d/%d] %s (%s)", done, len(todo), target, name)
+                continue
+            TRANSCODES.record(source, name, profile, stat, target, source_hash)
+            logging.info("✅ [%d/%d] %s", done, len(todo), target)
+    logging.info("Transcode done: %d encoded, %d skipped, %d failed", len(todo) - failed, skipped, failed)
+    return failed
+
+def read_batch(batch_path: str):
+    """Yield 'Title - Artist' lines from a file or stdin ('-'), skipping blanks.
+
+    Lines of a .jsonl file (src/exportify.py --jsonl) are yielded as dicts.
+    """
+    if batch_path == "-":
+        lines = sys.stdin
+    else:
+        lines = open(batch_path, encoding="utf-8")
+    try:
+        for line in lines:
+            line = line.strip()
+            if line and batch_path.endswith(".jsonl"):
+                yield json.loads(line)
+            elif line:
+                yield line
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+
+def parse_workers(values: list):
+    """Turn ['download=6', 'normalize=4'] into {'download': 6, 'normalize': 4}."""
+    stage_names = [name for name, _, _, _ in STAGES]
+    workers = {}
+    for value in values:
+        name, _, count = value.partition("=")
+        if name not in stage_names or not count.isdigit() or int(count) < 1:
+            raise SystemExit(f"Invalid --workers value '{value}', expected one of {stage_names}=N")
+        workers[name] = int(count)
+    return workers
+
+def parse_rates(values: list):
+    """Turn ['youtube=0.5', 'coverart=20'] into {'youtube': 0.5, 'coverart': 20.0}."""
+    rates = {}
+    for value in values:
+        name, _, rate = value.partition("=")
+        try:
+            rates[name] = float(rate)
+        except ValueError:
+            raise SystemExit(f"Invalid --rate value '{value}', expected one of {sorted(LIMITER.buckets)}=REQUESTS_PER_SECOND")
+        if name not in LIMITER.buckets:
+            raise SystemExit(f"Invalid --rate value '{value}', expected one of {sorted(LIMITER.buckets)}=REQUESTS_PER_SECOND")
+    return rates
+
+def log_summary(results: list):
+    """Log a per-track success/failure summary of a batch run."""
+    failed = [r for r in results if r["status"] == "failed"]
+    logging.info("--- Batch Summary: %d tracks, %d ok, %d failed ---", len(results), len(results) - len(failed), len(failed))
+    for r in results:
+        if r["status"] == "failed":
+            logging.error("❌ %s: %s", r["song"], r["error"])
+        else:
+            logging.info("✅ %s: %s", r["song"], r["status"])
+
+def log_metrics(results: list, options: dict):
+    """Log the timing summary of a run and merge its profiles, if they were asked for."""
+    if options.get("metrics"):
+        logging.info("--- Metrics (per track lines in '%s') ---\n%s", options["metrics"], json.dumps(metrics.summary(results), indent=2))
+    if options.get("profile"):
+        combined = metrics.merge_profiles(options["profile"])
+        if combined:
+            logging.info("Profile written to '%s' (python -m pstats '%s')", combined, combined)
+
 if __name__ == "__main__":
     # Argument Parser
     parser = argparse.ArgumentParser(description="Spotify ↔ YouTube helper")
+    parser.add_argument("command", nargs="?", choices=["serve", "submit"], help="'serve' runs a worker that takes jobs over localhost HTTP, 'submit' hands --song/--spotify/--batch to it")
     parser.add_argument("--song", default="", help="Search for ...")
     parser.add_argument("--youtube", default="", help="YouTube video URL")
     parser.add_argument("--cover", default="", help="Cover URL")
+    parser.add_argument("--spotify", default="", help="Spotify track or playlist URL/URI, metadata is taken from Spotify")
+    parser.add_argument("--batch", default="", help="File with one 'Title - Artist' per line ('-' for stdin) or a tracks.jsonl from src/exportify.py")
+    parser.add_argument("--parallel", action="store_true", help="Run --batch through the concurrent stage pipeline")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the lookup cache (no reads, no writes)")
+    parser.add_argument("--purge-cache", action="store_true", help="Empty the lookup cache before running")
+    parser.add_argument("--forget-youtube", default="", metavar="URL", help="Mark a Youtube_URL as a bad match so it's never picked again")
+    parser.add_argument("--search-mode", default="fallback", choices=["fallback", "scored"], help="'scored' runs all youtube query variants at once and scores every candidate")
+    parser.add_argument("--fused", action="store_true", help="Normalize, tag and compress in a single ffmpeg run")
+    parser.add_argument("--loudness-report", action="store_true", help="Print loudness statistics of every measured track and exit")
+    parser.add_argument("--http-timeout", type=float, default=30, metavar="SECONDS", help="Read timeout of network calls")
+    parser.add_argument("--retries", type=int, default=5, help="Retries (with exponential backoff) of failed network calls")
+    parser.add_argument("--rate", nargs="*", default=[], metavar="HOST=N", help="Requests per second per host (musicbrainz, coverart, youtube), 0 = unlimited")
+    parser.add_argument("--resume", action="store_true", help="Continue tracks of earlier runs from their last completed stage")
+    parser.add_argument("--retry-failed", action="store_true", help="Run every failed/unfinished job of earlier runs again")
+    parser.add_argument("--jobs", action="store_true", help="Print how many jobs sit at which status/stage and exit")
+    parser.add_argument("--workers", nargs="*", default=[], metavar="STAGE=N", help="Workers per pipeline stage, e.g. download=6 normalize=4")
+    parser.add_argument("--scratch", default=SCRATCH_DIR, metavar="DIR", help="Where tmp files go, e.g. /dev/shm to keep them off the disk")
+    parser.add_argument("--stream", action="store_true", help="Measure loudness while downloading instead of reading the file again")
+    parser.add_argument("--passthrough", action="store_true", help="Keep the downloaded Opus/AAC as is (remuxed, ReplayGain/R128 tags) and write the FLAC without baked-in gain")
+    parser.add_argument("--transcode", nargs="+", default=[], choices=list(TRANSCODE_PROFILES), metavar="PROFILE", help=f"Re-encode the --library FLACs into {TRANSCODE_PATH}/<profile> (changed files only) and exit: {', '.join(TRANSCODE_PROFILES)}")
+    parser.add_argument("--library", default="output", help="FLAC folder --transcode reads")
+    parser.add_argument("--metrics", nargs="?", const=metrics.METRICS_PATH, default=None, metavar="PATH", help=f"Append per-track timings as JSON lines (default {metrics.METRICS_PATH}) and log a summary")
+    parser.add_argument("--profile", default=None, metavar="DIR", help="cProfile every stage run into DIR (merged into DIR/combined.prof)")
+    parser.add_argument("--port", type=int, default=None, help="Localhost port of serve/submit (default 8765)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs serve runs at the same time")
     # TODO: Explicit Mode / Custom Filename
     args = parser.parse_args()
 
+    # Fast path: a track that's there already exits before logging, heavy imports or network
+    single = not (args.batch or args.spotify or args.retry_failed or args.jobs or args.transcode
+                  or args.loudness_report or args.purge_cache or args.forget_youtube)
+    if single and args.song:
+        done = already_done(args.song)
+        if done:
+            print(f"'{done}' already exists: skipping ({time.perf_counter() - STARTED:.2f}s)")
+            sys.exit(0)
+
+    if args.command:
+        # http.server and urllib.request only for these two
+        from src.server import SERVE_PORT, JobServer, request as server_request
+        args.port = args.port or SERVE_PORT
+    if args.command == "submit":
+        if args.batch:
+            body = {"lines": list(read_batch(args.batch))}
+        elif args.spotify:
+            body = {"spotify": args.spotify}
+        else:
+            body = {"song": args.song, "youtube": args.youtube, "cover": args.cover}
+        try:
+            code, answer = server_request("POST", "/jobs", body, port=args.port)
+        except OSError as e:
+            print(f"No server on port {args.port} ({e}), start one with 'main.py serve'")
+            sys.exit(1)
+        print(json.dumps(answer, indent=2))
+        sys.exit(0 if code < 400 else 1)
+
+    setup_logging()
+    logging.info("Started in %.2fs", time.perf_counter() - STARTED)
+
+    configure_network(read_timeout=args.http_timeout, retries=args.retries)
+    for name, rate in parse_rates(args.rate).items():
+        LIMITER.configure(name, rate)
+
+    # Lookup Cache
+    if args.purge_cache:
+        CACHE.purge()
+        if not args.song and not args.youtube and not args.batch:
+            sys.exit(0)
+    if args.forget_youtube:
+        forget_youtube_url(args.forget_youtube)
+        if not args.song and not args.youtube and not args.batch:
+            sys.exit(0)
+    if args.transcode:
+        sys.exit(1 if transcode_library(args.library, args.transcode) else 0)
+    if args.loudness_report:
+        print(json.dumps(LOUDNESS.report(), indent=2))
+        sys.exit(0)
+    CACHE.enabled = not args.no_cache
+    LOUDNESS.enabled = not args.no_cache
+    SEARCH_MODE = args.search_mode
+    options = {
+        "fused": args.fused,
+        "manifest": True,
+        "resume": args.resume or args.retry_failed,
+        "metrics": args.metrics,
+        "profile": args.profile,
+        "scratch": args.scratch,
+        "stream": args.stream,
+        "passthrough": args.passthrough,
+    }
+
+    if args.jobs:
+        print(json.dumps(MANIFEST.summary(), indent=2))
+        sys.exit(0)
+
+    if args.command == "serve":
+        # Long lived: warm search instances, sessions and caches for every submission
+        JobServer(partial(request_jobs, options=options), run_job, args.concurrency).serve(port=args.port)
+        sys.exit(0)
+
+    spotify = parse_spotify(args.spotify) if args.spotify else None
+    if args.spotify and spotify is None:
+        logging.error("Not a Spotify URL/URI: '%s'\n", args.spotify)
+        sys.exit(1)
+
+    if args.batch or args.retry_failed or (spotify and spotify[0] == "playlist"):
+        if args.retry_failed:
+            logging.info("Retrying failed jobs of earlier runs")
+            jobs = (resume_job({**saved, "options": options}) for saved in MANIFEST.failed())
+        elif args.batch:
+            logging.info("Starting batch run from '%s'", args.batch)
+            # Spotify links in the batch are resolved 50 at a time
+            jobs = prepare_jobs(resolve_lines(read_batch(args.batch)), options)
+        else:
+            logging.info("Starting batch run from Spotify playlist '%s'", args.spotify)
+            jobs = prepare_jobs(resolve_lines([args.spotify]), options)
+        if args.parallel:
+            workers = parse_workers(args.workers)
+            stages = [(name, partial(run_stage, name), kind, workers.get(name, default)) for name, _, kind, default in STAGES]
+            results = [finish_job(job) for job in run_pipeline(jobs, stages, initializer=init_worker, initargs=(worker_settings(),))]
+        else:
+            results = [run_job(job) for job in jobs]
+        log_summary(results)
+        log_metrics(results, options)
+        sys.exit(0 if all(r["status"] != "failed" for r in results) else 1)
+
     # Main Variables
     logging.info("Starting to download a new Track with given data")
     if not args.song and not args.youtube:
@@ -417,126 +1789,19 @@ if __name__ == "__main__":
         song = args.song
         youtube = args.youtube
 
-    # Secondary Variables
-    tolerance_sec = 2
-    max_results_ytsearch = 10
-    # TODO: specific tmp files for parallel works
-    input_file = "output/tmp_downloaded.wav"
-    tmp_file = "output/tmp_normalized.wav"
-    tmp_cover = "output/tmp_cover_data.jpg"
-    COMPRESSION_OPT_PATH = "output/compressed (ohio-impressed)"
-
-    if os.path.exists(input_file):
-        os.remove(input_file)
-        logging.warning("Overwriting tmp_downloaded file")
-    if os.path.exists(tmp_file):
-        os.remove(tmp_file)
-        logging.warning("Overwriting tmp_normalized file")
-    if os.path.exists(tmp_cover):
-        os.remove(tmp_cover)
-        logging.warning("Overwriting tmp_cover_data file")
+    track = None
+    if spotify:
+        metadata = get_metadata_spotify(args.spotify)
+        if metadata is None:
+            sys.exit(1)
+        track = track_record(metadata)
+        song = song or track["song"]
 
     # Validate Important Args
-    if not song and not youtube :
+    if not song and not youtube:
         logging.error("No Song name or Youtube URL\n")
         sys.exit(1)
-    else:
-        if song and youtube:
-            logging.info(
-                "... Processing: '%s' (%s) ---",
-                song,
-                youtube
-            )
-            song_data = sanitize_filename(song)
-            METADATA = get_metadata_musicbrainz(song_data['title'], song_data['artist'])
-            filename_data = sanitize_filename(f"{METADATA['title']} - {METADATA['artist']}")
-            opt_filename: str = f"{filename_data['title']} - {filename_data['artist']}"
-            logging.info("Song name is: (%s)", song)
-            logging.info("Youtube_URL is: (%s)", youtube)
-        if not song:
-            logging.info("... Processing: (%s)", youtube)
-            # TODO: Derive song from youtube url
-            logging.info("No Song name given, generated one is: (%s)", song)
-        if not youtube:
-            logging.info("... Processing: '%s'", song)
-            song_data = sanitize_filename(song)
-            METADATA = get_metadata_musicbrainz(song_data['title'], song_data['artist'])
-            filename_data = sanitize_filename(f"{METADATA['title']} - {METADATA['artist']}")
-            opt_filename: str = f"{filename_data['title']} - {filename_data['artist']}"
-            
-    # smaller optional args
-    if args.cover:
-        logging.info("Cover_URL is: (%s)", args.cover)
-        METADATA['cover_url'] = args.cover
-
-    # Correct File Name
-    Path("output").mkdir(exist_ok=True)
-    final_file = {
-        "path": f"output/{opt_filename}.flac",
-        "compress": True,
-        "codec": "libopus",
-        "container": "opus",
-        "bitrate": "128k"
-    }
-    FILE_COMPRESSED = f"{COMPRESSION_OPT_PATH}/{opt_filename}.{final_file["container"]}"
-
-    match check_filepaths(final_file["path"], final_file["compress"]):
-        case 1: # All files already there
-            logging.info("File '%s' already exists & compression deactivated: closing\n", final_file["path"])
-            sys.exit(0)
-        case 2: # Skipping to compression
-            logging.info("File '%s' already exists & compression activated: skipping to compression", final_file["path"])
-        case 0: # No initial file there, downloading audio
-            if not youtube: # Fetch Youtube URL
-                # QUERY = f"{METADATA['title']} - {METADATA['artist']}"
-                QUERY = opt_filename
-                youtube = get_youtube_link(QUERY, tolerance_sec, max_results_ytsearch, METADATA)
-                if youtube is None:
-                    # Fallback to user Input
-                    USER_INPUT = f"{song_data['title']} - {song_data['artist']}"
-
-                    # Redefining/Revalidating Things
-                    QUERY = USER_INPUT
-                    final_file["path"] = f"output/{USER_INPUT}.flac"
-                    FILE_COMPRESSED = f"{COMPRESSION_OPT_PATH}/{USER_INPUT}.{final_file["container"]}"
-
-                    # Running loop again
-                    match check_filepaths(final_file["path"], final_file["compress"]):
-                        case 1: # All files already there
-                            logging.info("File '%s' already exists & compression deactivated: closing\n", final_file["path"])
-                            sys.exit(0)
-                        case 2: # Skipping to compression
-                            logging.info("File '%s' already exists & compression activated: skipping to compression", final_file["path"])
-                        case 0: # No initial file there, downloading audio
-                            logging.critical("Fetching Youtube_URL failed, falling back to user input query: '%s'", QUERY)
-                            youtube = get_youtube_link(QUERY, tolerance_sec, max_results_ytsearch, METADATA)
-                            if youtube is None:
-                                logging.error("Fetching Youtube_URL failed for all Queries\n")
-                                sys.exit(1)
-                logging.info("No Youtube_URL given, generated one is: (%s)", youtube)
-
-            download_audio(input_file, youtube)
-
-            measured = analyze_audio(input_file)
-            normalize_audio(input_file, tmp_file, measured)
-
-            embed_metadata(tmp_file, final_file["path"], tmp_cover, METADATA)
-
-            # Delete Temp Files
-            logging.debug("removing temp files")
-            os.remove(tmp_file)
-            os.remove(input_file)
-            os.remove(tmp_cover)
-
-    # Compress Audio
-    if check_filepaths(final_file["path"], final_file["compress"]) == 0:
-        logging.error("`%s` was never written\n", final_file["path"])
-        sys.exit(1)
-    else:
-        Path(COMPRESSION_OPT_PATH).mkdir(exist_ok=True)
-        compress_audio(final_file, FILE_COMPRESSED)
-        # os.remove(final_file["path"]) # Delete large file
-        logging.info("✅ Compressed: '%s'", FILE_COMPRESSED)
 
-    logging.info("✅ Downloaded: '%s'\n", final_file["path"])
-    sys.exit(0)
+    job = process_track(song, youtube, args.cover, options, track)
+    log_metrics([job], options)
+    sys.exit(0 if job["status"] != "failed" else 1)
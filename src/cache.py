@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+CACHE_DB = "assets/cache.sqlite3"
+
+DAY = 24 * 60 * 60
+
+class SqliteStore:
+    """Base of the sqlite backed stores: one WAL connection per thread and pid.
+
+    Subclasses set SCHEMA, the CREATE statement(s) run on every new connection.
+    """
+
+    SCHEMA = ""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        # sqlite connections can't cross threads or forks, one per thread/pid
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+class Cache(SqliteStore):
+    """Small persistent key/value store on SQLite, split into namespaces.
+
+    Values are JSON (or raw bytes) and carry their write time, so every reader
+    decides on its own TTL. A stored None is a negative result ("looked it up,
+    nothing there") and gets its own, usually shorter, TTL.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS cache ("
+        " namespace TEXT NOT NULL,"
+        " key TEXT NOT NULL,"
+        " value BLOB,"
+        " created REAL NOT NULL,"
+        " PRIMARY KEY (namespace, key))"
+    )
+
+    def __init__(self, path: str = CACHE_DB):
+        super().__init__(path)
+        self.enabled = True
+
+    def get(self, namespace: str, key: str, ttl: float, negative_ttl: float = None):
+        """Return (hit, value), hit is False when missing, expired or disabled."""
+        if not self.enabled:
+            return False, None
+        row = self._conn().execute(
+            "SELECT value, created FROM cache WHERE namespace = ? AND key = ?",
+            (namespace, key)
+        ).fetchone()
+        if row is None:
+            return False, None
+        value, created = row
+        max_age = ttl if value is not None or negative_ttl is None else negative_ttl
+        if time.time() - created > max_age:
+            logging.debug("Cache expired: %s/%s", namespace, key)
+            return False, None
+        if isinstance(value, bytes) or value is None:
+            return True, value
+        return True, json.loads(value)
+
+    def set(self, namespace: str, key: str, value):
+        if not self.enabled:
+            return
+        if value is not None and not isinstance(value, bytes):
+            value = json.dumps(value)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, created) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, time.time())
+            )
+
+    def scan(self, namespace: str):
+        """Yield (key, value) of every entry in a namespace, expired ones too."""
+        rows = self._conn().execute(
+            "SELECT key, value FROM cache WHERE namespace = ?", (namespace,)
+        ).fetchall()
+        for key, value in rows:
+            if isinstance(value, bytes) or value is None:
+                yield key, value
+            else:
+                yield key, json.loads(value)
+
+    def delete(self, namespace: str, key: str):
+        with self._conn() as conn:
+            deleted = conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            ).rowcount
+        return deleted
+
+    def purge(self, namespace: str = None):
+        """Drop one namespace or everything, returns the number of rows removed."""
+        with self._conn() as conn:
+            if namespace is None:
+                deleted = conn.execute("DELETE FROM cache").rowcount
+            else:
+                deleted = conn.execute("DELETE FROM cache WHERE namespace = ?", (namespace,)).rowcount
+        logging.info("Purged %d cache entries (%s)", deleted, namespace or "all")
+        return deleted
+
+def cache_key(*parts: str):
+    """Normalize parts (case, whitespace) into one stable key."""
+    return "\x1f".join(" ".join(str(p).lower().split()) for p in parts)
+
+# Shared instance, configured by main.py's CLI
+CACHE = Cache()
@@ -0,0 +1,71 @@
+import logging
+import os
+import time
+
+from src.cache import SqliteStore
+
+DONE_DB = "assets/done.sqlite3"
+
+# Identities a produced track is known by
+KEY_TYPES = ("recording_id", "isrc", "spotify_uri", "youtube_id", "input")
+
+class DoneIndex(SqliteStore):
+    """Index of already produced tracks, keyed by recording identity instead of filename.
+
+    The same recording under a slightly different title/artist credit (or the
+    user input fallback filename) still maps to the file made the first time.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS done ("
+        " key_type TEXT NOT NULL,"
+        " key TEXT NOT NULL,"
+        " path TEXT NOT NULL,"
+        " compressed TEXT,"
+        " created REAL NOT NULL,"
+        " PRIMARY KEY (key_type, key))"
+    )
+
+    def __init__(self, path: str = DONE_DB):
+        super().__init__(path)
+        self.enabled = True
+
+    def record(self, keys: dict, path: str, compressed: str = None):
+        """Remember that path (and compressed) hold the track known by keys."""
+        if not self.enabled:
+            return
+        rows = [
+            (key_type, str(key), path, compressed, time.time())
+            for key_type, key in keys.items()
+            if key_type in KEY_TYPES and key
+        ]
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO done (key_type, key, path, compressed, created) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(key_type, key) DO UPDATE SET path = excluded.path,"
+                " compressed = COALESCE(excluded.compressed, done.compressed), created = excluded.created",
+                rows
+            )
+
+    def lookup(self, keys: dict):
+        """First produced track matching any of keys whose file still exists, else None."""
+        if not self.enabled:
+            return None
+        for key_type in KEY_TYPES:
+            key = keys.get(key_type)
+            if not key:
+                continue
+            row = self._conn().execute(
+                "SELECT path, compressed FROM done WHERE key_type = ? AND key = ?", (key_type, str(key))
+            ).fetchone()
+            if row is None:
+                continue
+            path, compressed = row
+            if not os.path.exists(path):
+                logging.debug("Done index entry '%s' points to a missing file, ignoring it", path)
+                continue
+            return {"key_type": key_type, "path": path, "compressed": compressed}
+        return None
+
+# Shared instance
+DONE = DoneIndex()
@@ -1,50 +1,44 @@
 import argparse
-import csv
-import platform
+import json
+
+from src.ingest import ARTIST_COLUMN, TITLE_COLUMN, iter_rows, row_metadata
 
 # --- CONFIG ---
 OUTPUT = "assets/tracks.txt"
-
-# Column name from the CSV for song title (depends on export)
-TITLE_COLUMN = "Track Name"  # Exportify usually uses this
-ARTIST_COLUMN = "Artist Name(s)" # And this
+OUTPUT_JSONL = "assets/tracks.jsonl"
 
 if __name__ == "__main__":
     # Argument Parser
-    parser = argparse.ArgumentParser(description="m3u file generator")
-    parser.add_argument("--csv", default="", help="CSV file Path")
+    parser = argparse.ArgumentParser(description="tracks.txt generator")
+    parser.add_argument("--csv", nargs="+", default=[], help="CSV file Path(s) or folders of exports")
+    parser.add_argument("--jsonl", action="store_true", help=f"Also write {OUTPUT_JSONL} with the CSV metadata (for main.py --batch)")
+    parser.add_argument("--keep-duplicates", action="store_true", help="Don't merge tracks that are in several playlists")
     args = parser.parse_args()
-    
+
     # Check if everything is there
     if not args.csv:
         print("Non existing csv file path")
-    
-    # Set Args
-    if platform.system() == 'Windows':
-        csv_file = fr"{args.csv}"
-        music_dir = fr"{args.music}"  # Search for Songs in ...
-    elif platform.system() == 'Linux':
-        csv_file = f"{args.csv}"
-    print("Using : ", csv_file)
-    
-    
-    with open(csv_file, newline='', encoding="utf-8") as csvfile:
-        reader = list(csv.DictReader(csvfile))
-        song_names = [row[TITLE_COLUMN] for row in reader]
-        artist = [row[ARTIST_COLUMN] for row in reader]
-
-    songs = []
-    missing = []
-
-    for song, artist in zip(song_names, artist):
-        songs.append(f"{song} - {artist}")
+        raise SystemExit(1)
+    print("Using : ", ", ".join(args.csv))
 
-    with open(OUTPUT, "w", encoding="utf-8") as file:
-        for song in songs:
-            file.write(song + "\n")
+    # Rows are streamed and written one by one
+    stats = {}
+    written = 0
+    complete = 0
+    jsonl = open(OUTPUT_JSONL, "w", encoding="utf-8") if args.jsonl else None
+    try:
+        with open(OUTPUT, "w", encoding="utf-8") as file:
+            for row in iter_rows(args.csv, dedupe=not args.keep_duplicates, stats=stats):
+                file.write(f"{row[TITLE_COLUMN]} - {row[ARTIST_COLUMN]}\n")
+                if jsonl:
+                    record = row_metadata(row)
+                    jsonl.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    complete += record["complete"]
+                written += 1
+    finally:
+        if jsonl:
+            jsonl.close()
 
-    print(f"✅ Playlist written to {OUTPUT}")
-    if missing:
-        print("⚠️ Songs not found:")
-        for song, artist in missing:
-            print(f"{song} - {artist}")
+    if args.jsonl:
+        print(f"✅ {OUTPUT_JSONL}: {complete} of {written} tracks have complete metadata (no MusicBrainz needed)")
+    print(f"✅ {written} tracks from {stats['files']} file(s) written to {OUTPUT} ({stats['duplicates']} duplicates skipped)")
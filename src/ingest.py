@@ -0,0 +1,100 @@
+import csv
+import hashlib
+import os
+
+from src.cache import cache_key
+
+# Column names from the CSV (depends on export)
+TITLE_COLUMN = "Track Name"  # Exportify usually uses this
+ARTIST_COLUMN = "Artist Name(s)" # And this
+URI_COLUMN = "Track URI"
+
+# Metadata columns, older and newer Exportify versions name some differently
+METADATA_COLUMNS = {
+    "album": ["Album Name"],
+    "date": ["Release Date", "Album Release Date"],
+    "duration_ms": ["Duration (ms)", "Track Duration (ms)"],
+    "isrc": ["ISRC"],
+    "genres": ["Genres", "Artist Genres"],
+    "cover_url": ["Album Image URL"],
+}
+
+# What a row needs so main.py can skip MusicBrainz
+REQUIRED_METADATA = ["title", "artist", "album", "date", "duration_ms", "cover_url"]
+
+def csv_files(paths: list):
+    """Expand CSV paths and directories of exports into single CSV files."""
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(".csv"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+def track_keys(row: dict):
+    """Identities of a row across playlists: the Spotify URI and title + artist.
+
+    Exports with and without a URI column still dedupe against each other.
+    """
+    identities = [cache_key(row.get(TITLE_COLUMN, ""), row.get(ARTIST_COLUMN, ""))]
+    uri = (row.get(URI_COLUMN) or "").strip()
+    if uri:
+        identities.append(uri)
+    # 8 byte digests, so the seen-set stays small for huge merges
+    return [hashlib.blake2b(identity.encode(), digest_size=8).digest() for identity in identities]
+
+def iter_rows(paths: list, dedupe: bool = True, stats: dict = None):
+    """Stream the rows of many CSVs in one pass, one row in memory at a time.
+
+    Tracks that appear in several playlists are only yielded the first time.
+    stats (optional) gets counts of files, rows and duplicates.
+    """
+    seen = set()
+    if stats is None:
+        stats = {}
+    stats.update(files=0, rows=0, duplicates=0)
+    for csv_file in csv_files(paths):
+        stats["files"] += 1
+        with open(csv_file, newline='', encoding="utf-8") as csvfile:
+            for row in csv.DictReader(csvfile):
+                stats["rows"] += 1
+                if dedupe:
+                    keys = track_keys(row)
+                    if any(key in seen for key in keys):
+                        stats["duplicates"] += 1
+                        continue
+                    seen.update(keys)
+                yield row
+
+def _column(row: dict, field: str):
+    for column in METADATA_COLUMNS[field]:
+        value = (row.get(column) or "").strip()
+        if value:
+            return value
+    return None
+
+def row_metadata(row: dict):
+    """Track record of a row, metadata in the shape embed_metadata expects.
+
+    Only the first artist goes into "artist" (MusicBrainz does the same, so the
+    file names match), all of them are kept in "artists".
+    """
+    artists = [a.strip() for a in row.get(ARTIST_COLUMN, "").split(",") if a.strip()]
+    duration = _column(row, "duration_ms")
+    genres = _column(row, "genres")
+    record = {
+        "song": f"{row[TITLE_COLUMN]} - {row[ARTIST_COLUMN]}",
+        "title": row[TITLE_COLUMN].strip() or None,
+        "artist": artists[0] if artists else None,
+        "artists": artists,
+        "album": _column(row, "album"),
+        "date": _column(row, "date"),
+        "duration_ms": int(float(duration)) if duration else None,
+        "isrc": _column(row, "isrc"),
+        "genres": [g.strip() for g in genres.split(",") if g.strip()] if genres else [],
+        "cover_url": _column(row, "cover_url"),
+        "spotify_uri": (row.get(URI_COLUMN) or "").strip() or None,
+    }
+    record["complete"] = all(record[field] for field in REQUIRED_METADATA)
+    return record
@@ -0,0 +1,114 @@
+import logging
+import os
+import re
+
+from src.cache import SqliteStore
+
+LIBRARY_DB = "assets/library.sqlite3"
+
+AUDIO_EXTENSIONS = {".flac", ".opus", ".ogg", ".mp3", ".m4a", ".aac", ".wav", ".wma", ".alac"}
+
+def tokens(text: str):
+    """Lowercase word tokens, punctuation dropped."""
+    return re.findall(r"\w+", text.lower())
+
+class LibraryIndex(SqliteStore):
+    """Persistent index of the audio files below a music dir.
+
+    Stores path, name tokens, size and mtime per file plus the mtime and
+    sub dirs of every directory. refresh() only lists directories whose mtime
+    changed (files added, removed or renamed), everything else is a stat call.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS dirs ("
+        " root TEXT NOT NULL, path TEXT NOT NULL, mtime INTEGER NOT NULL, subdirs TEXT NOT NULL,"
+        " PRIMARY KEY (root, path));"
+        "CREATE TABLE IF NOT EXISTS files ("
+        " root TEXT NOT NULL, dir TEXT NOT NULL, path TEXT NOT NULL, name TEXT NOT NULL,"
+        " tokens TEXT NOT NULL, size INTEGER, mtime INTEGER,"
+        " PRIMARY KEY (root, path));"
+        "CREATE INDEX IF NOT EXISTS files_dir ON files (root, dir)"
+    )
+
+    def __init__(self, music_dir: str, path: str = LIBRARY_DB):
+        super().__init__(path)
+        self.root = os.path.abspath(music_dir)
+        self.files = []
+
+    def refresh(self, rebuild: bool = False):
+        """Bring the index up to date, returns (rescanned dirs, total dirs)."""
+        if rebuild:
+            with self._conn() as conn:
+                conn.execute("DELETE FROM dirs WHERE root = ?", (self.root,))
+                conn.execute("DELETE FROM files WHERE root = ?", (self.root,))
+        known = {
+            path: (mtime, subdirs.split("\n") if subdirs else [])
+            for path, mtime, subdirs in self._conn().execute(
+                "SELECT path, mtime, subdirs FROM dirs WHERE root = ?", (self.root,)
+            )
+        }
+        seen = set()
+        rescanned = 0
+        stack = [self.root]
+        with self._conn() as conn:
+            while stack:
+                directory = stack.pop()
+                if directory in seen:
+                    continue
+                try:
+                    mtime = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                seen.add(directory)
+                if directory in known and known[directory][0] == mtime:
+                    stack.extend(known[directory][1])
+                    continue
+                subdirs = self._scan_dir(directory, mtime)
+                rescanned += 1
+                stack.extend(subdirs)
+            # Directories that are gone
+            for directory in set(known) - seen:
+                conn.execute("DELETE FROM dirs WHERE root = ? AND path = ?", (self.root, directory))
+                conn.execute("DELETE FROM files WHERE root = ? AND dir = ?", (self.root, directory))
+        logging.info("Library index: rescanned %d of %d directories", rescanned, len(seen))
+        return rescanned, len(seen)
+
+    def _scan_dir(self, directory: str, mtime: int):
+        subdirs = []
+        rows = []
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            logging.warning("Can't list '%s': %s", directory, str(e))
+            entries = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+                continue
+            name, extension = os.path.splitext(entry.name)
+            if extension.lower() not in AUDIO_EXTENSIONS:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError: # dangling symlink, or gone since the listing
+                continue
+            rows.append((self.root, directory, entry.path, name, " ".join(tokens(name)), stat.st_size, stat.st_mtime_ns))
+        conn = self._conn()
+        conn.execute("DELETE FROM files WHERE root = ? AND dir = ?", (self.root, directory))
+        conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute(
+            "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)",
+            (self.root, directory, mtime, "\n".join(subdirs))
+        )
+        return subdirs
+
+    def load(self):
+        """Read the index into memory."""
+        self.files = [
+            {"path": path, "name": name, "lower": name.lower(), "tokens": token_str.split()}
+            for path, name, token_str in self._conn().execute(
+                "SELECT path, name, tokens FROM files WHERE root = ? ORDER BY path", (self.root,)
+            )
+        ]
+        return self
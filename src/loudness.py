@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import os
+import statistics
+import time
+
+from src.cache import CACHE_DB, SqliteStore
+
+# Fields of the loudnorm json that normalize_audio needs
+MEASURED_FIELDS = ["input_i", "input_tp", "input_lra", "input_thresh", "target_offset"]
+
+HASH_CHUNK = 1024 * 1024
+
+def content_hash(path: str):
+    """Fast hash of a file: its size plus the first, middle and last MiB.
+
+    Good enough to recognise the same downloaded stream again without
+    reading hundreds of MB.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(str(size).encode(), digest_size=20)
+    with open(path, "rb") as f:
+        for offset in (0, max(0, size // 2 - HASH_CHUNK // 2), max(0, size - HASH_CHUNK)):
+            f.seek(offset)
+            digest.update(f.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+class LoudnessStore(SqliteStore):
+    """Sidecar table of loudnorm measurements, keyed by content hash + target."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS loudness ("
+        " hash TEXT NOT NULL,"
+        " target TEXT NOT NULL,"
+        " input_i REAL, input_tp REAL, input_lra REAL,"
+        " input_thresh REAL, target_offset REAL,"
+        " title TEXT,"
+        " created REAL NOT NULL,"
+        " PRIMARY KEY (hash, target))"
+    )
+
+    def __init__(self, path: str = CACHE_DB):
+        super().__init__(path)
+        self.enabled = True
+
+    def get(self, content: str, target: str):
+        if not self.enabled:
+            return None
+        row = self._conn().execute(
+            f"SELECT {', '.join(MEASURED_FIELDS)} FROM loudness WHERE hash = ? AND target = ?",
+            (content, target)
+        ).fetchone()
+        if row is None:
+            return None
+        # Same shape (strings) as the loudnorm json
+        return {field: str(value) for field, value in zip(MEASURED_FIELDS, row)}
+
+    def set(self, content: str, target: str, measured: dict, title: str = None):
+        if not self.enabled:
+            return
+        with self._conn() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO loudness (hash, target, {', '.join(MEASURED_FIELDS)}, title, created)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (content, target, *(float(measured[field]) for field in MEASURED_FIELDS), title, time.time())
+            )
+
+    def report(self):
+        """Library loudness statistics of everything measured so far."""
+        rows = self._conn().execute("SELECT input_i, input_tp, input_lra FROM loudness").fetchall()
+        stats = {"tracks": len(rows)}
+        for index, name in enumerate(["input_i", "input_tp", "input_lra"]):
+            values = [row[index] for row in rows if row[index] is not None and abs(row[index]) != float("inf")]
+            if values:
+                stats[name] = {
+                    "min": min(values),
+                    "median": statistics.median(values),
+                    "mean": round(statistics.fmean(values), 2),
+                    "max": max(values),
+                }
+        loudest = self._conn().execute(
+            "SELECT title, input_i FROM loudness WHERE title IS NOT NULL ORDER BY input_i DESC LIMIT 5"
+        ).fetchall()
+        stats["loudest"] = [{"title": title, "input_i": value} for title, value in loudest]
+        return stats
+
+def measure_loudness(file: str, target: str, analyze, title: str = None):
+    """analyze(file) unless the same content was measured for this target before."""
+    content = content_hash(file)
+    measured = LOUDNESS.get(content, target)
+    if measured is not None:
+        logging.debug("Loudness cache hit for '%s'", title or file)
+        return measured
+    measured = analyze(file)
+    LOUDNESS.set(content, target, measured, title)
+    return measured
+
+# Shared instance, configured by main.py's CLI
+LOUDNESS = LoudnessStore()
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import time
+
+from src.cache import SqliteStore, cache_key
+
+JOBS_DB = "assets/jobs.sqlite3"
+
+def job_id(song: str, youtube: str = "", cover: str = ""):
+    """Stable id of a track request, the same line in a later run maps to the same job."""
+    return hashlib.blake2b(cache_key(song, youtube, cover).encode(), digest_size=8).hexdigest()
+
+class JobManifest(SqliteStore):
+    """Persistent record of every job: last completed stage, status and artifacts.
+
+    The whole job dict is stored, so a crashed or interrupted run can pick a
+    track up at the stage after the last completed one.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " id TEXT PRIMARY KEY,"
+        " song TEXT,"
+        " stage TEXT,"
+        " status TEXT NOT NULL,"
+        " error TEXT,"
+        " attempts INTEGER NOT NULL DEFAULT 0,"
+        " job TEXT NOT NULL,"
+        " updated REAL NOT NULL)"
+    )
+
+    def __init__(self, path: str = JOBS_DB):
+        super().__init__(path)
+
+    def save(self, job: dict):
+        stage = job["completed"][-1] if job["completed"] else None
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, song, stage, status, error, attempts, job, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(id) DO UPDATE SET song = excluded.song, stage = excluded.stage,"
+                " status = excluded.status, error = excluded.error, attempts = excluded.attempts,"
+                " job = excluded.job, updated = excluded.updated",
+                (job["id"], job["song"], stage, job["status"], job["error"], job["attempts"],
+                 json.dumps(job), time.time())
+            )
+
+    def load(self, id: str):
+        row = self._conn().execute("SELECT job FROM jobs WHERE id = ?", (id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def failed(self):
+        """Every job whose last attempt failed or never finished."""
+        rows = self._conn().execute(
+            "SELECT job FROM jobs WHERE status IN ('failed', 'pending') ORDER BY updated"
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def summary(self):
+        rows = self._conn().execute(
+            "SELECT status, COALESCE(stage, '-'), COUNT(*) FROM jobs GROUP BY 1, 2 ORDER BY 1, 2"
+        ).fetchall()
+        return [{"status": status, "stage": stage, "jobs": count} for status, stage, count in rows]
+
+# Shared instance
+MANIFEST = JobManifest()
@@ -0,0 +1,132 @@
+import os
+import re
+from collections import Counter
+
+from src.naming import sanitize_filename
+
+# Credits and remaster suffixes that Spotify/MusicBrainz/filenames disagree on
+_NOISE = re.compile(
+    r"[\(\[]\s*(feat|ft|with)\.?\s[^\)\]]*[\)\]]"   # (feat. X) [with Y]
+    r"|\s(feat|ft)\.?\s.*$"                        # feat. X at the end
+    r"|[\(\[][^\)\]]*\bremaster(ed)?\b[^\)\]]*[\)\]]"  # (Remastered 2009)
+    r"|\s-\s.*\bremaster(ed)?\b.*$",               # - 2011 Remaster
+    re.IGNORECASE
+)
+
+# Words that make a different recording of the same song, they have to agree
+VERSION_WORDS = {
+    "live", "acoustic", "unplugged", "demo", "remix", "mix", "edit", "instrumental",
+    "karaoke", "extended", "reprise", "mono", "stereo", "cover", "orchestral",
+}
+_ROMAN = re.compile(r"x{0,3}(ix|iv|v?i{0,3})")
+_ROMAN_VALUES = {"i": 1, "v": 5, "x": 10}
+
+NGRAM = 3
+CANDIDATE_GRAMS = 8  # rarest query grams used to pick candidates
+MAX_CANDIDATES = 64  # files sharing most of them get fully scored
+MIN_TITLE_SCORE = 0.9  # title similarity a file needs whatever the artist score
+
+def normalize(text: str):
+    text = _NOISE.sub("", text.lower())
+    # Don't -> dont, not "don t"
+    return " ".join(re.findall(r"\w+", re.sub(r"['’]", "", text)))
+
+def _roman(token: str):
+    if not _ROMAN.fullmatch(token):
+        return None
+    values = [_ROMAN_VALUES[c] for c in token]
+    return sum(-v if i + 1 < len(values) and v < values[i + 1] else v for i, v in enumerate(values))
+
+def title_marks(text: str):
+    """Version words and numbers (digits or roman) of a title.
+
+    They change few characters but make a different track: "Part I" vs
+    "Part II", "No. 5" vs "No. 9", "Love Me" vs "Love Me (Live)".
+    """
+    marks = set()
+    for token in normalize(text or "").split():
+        if token in VERSION_WORDS:
+            marks.add(token)
+        elif token.isdigit():
+            marks.add(int(token))
+        elif (number := _roman(token)) is not None:
+            marks.add(number)
+    return marks
+
+def same_version(a: str, b: str):
+    """Do two titles carry the same version words and numbers?"""
+    return title_marks(a) == title_marks(b)
+
+def ngrams(text: str):
+    padded = f" {text} "
+    return {padded[i:i + NGRAM] for i in range(len(padded) - NGRAM + 1)}
+
+def _dice(a: set, b: set):
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+def similarity(a: str, b: str):
+    """0..1 n-gram similarity of two titles/artists, after dropping the credit/version noise."""
+    return _dice(ngrams(normalize(a or "")), ngrams(normalize(b or "")))
+
+def split_name(song_artists: str):
+    """Title/artist exactly as main.py's output filenames are built."""
+    data = sanitize_filename(song_artists)
+    return data["title"], data["artist"]
+
+class FuzzyMatcher:
+    """Character n-gram matcher of playlist rows against library files.
+
+    Every file's title/artist grams are computed once and put in an inverted
+    index (gram -> file ids). A row only scores the files sharing its rarest
+    grams, so matching thousands of rows against a big library stays fast.
+    Score = 0.7 title similarity + 0.3 artist similarity (Dice coefficient).
+    A file is only taken if its title is at least MIN_TITLE_SCORE similar and
+    has the same version words and numbers, a good artist can't make up for
+    "Symphony No. 5" when "No. 9" was asked for.
+    """
+
+    def __init__(self, files: list):
+        self.paths = []
+        self.title_grams = []
+        self.artist_grams = []
+        self.marks = []
+        self.index = {}
+        for f in files:
+            stem = os.path.splitext(os.path.basename(f["path"]))[0]
+            title, artist = split_name(stem)
+            file_id = len(self.paths)
+            self.paths.append(f["path"])
+            self.title_grams.append(ngrams(normalize(title)))
+            self.artist_grams.append(ngrams(normalize(artist)))
+            self.marks.append(title_marks(title))
+            for gram in self.title_grams[-1]:
+                self.index.setdefault(gram, []).append(file_id)
+
+    def match(self, title: str, artists: str):
+        """Best (path, score) for a CSV row, (None, best score) if no file is the same track."""
+        # Same sanitising + length caps the file name went through
+        title, _ = split_name(f"{title} - {artists}")
+        query = ngrams(normalize(title))
+        marks = title_marks(title)
+        rare = sorted((gram for gram in query if gram in self.index), key=lambda g: len(self.index[g]))
+        hits = Counter()
+        for gram in rare[:CANDIDATE_GRAMS]:
+            hits.update(self.index[gram])
+        if not hits:
+            return None, 0.0
+        candidates = [file_id for file_id, _ in hits.most_common(MAX_CANDIDATES)]
+
+        # The file names only carry the first credited artist
+        artist_options = [ngrams(normalize(a)) for a in re.split(r",|&|;", artists) if a.strip()] or [set()]
+        best_path, best_score, rejected_score = None, 0.0, 0.0
+        for file_id in candidates:
+            title_score = _dice(query, self.title_grams[file_id])
+            artist_score = max(_dice(option, self.artist_grams[file_id]) for option in artist_options)
+            score = 0.7 * title_score + 0.3 * artist_score
+            if title_score < MIN_TITLE_SCORE or self.marks[file_id] != marks:
+                rejected_score = max(rejected_score, score)
+            elif score > best_score:
+                best_path, best_score = self.paths[file_id], score
+        return best_path, round(best_score if best_path else rejected_score, 3)
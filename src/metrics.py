@@ -0,0 +1,213 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+METRICS_PATH = "assets/metrics.jsonl"
+
+# Record of the job/stage running in this thread, see span()
+_local = threading.local()
+_lock = threading.Lock()
+
+def new_record():
+    """Metrics of one track, travels in the job dict (also through process pools)."""
+    return {
+        "stages": {},       # wall seconds per stage
+        "python_cpu": {},   # CPU seconds of this process per stage
+        "ffmpeg_cpu": {},   # user + sys seconds of ffmpeg runs per stage
+        "bytes_downloaded": 0,
+        "search_queries": 0,  # youtube searches that weren't served from the cache
+        "fallback_depth": None,  # 0 = resolved before, 1 plain, 2 topic, 3 lyrics, 4 first result
+    }
+
+def current():
+    """Record of the running span (None outside of one)."""
+    return getattr(_local, "record", None)
+
+@contextmanager
+def activate(record: dict, stage: str = None):
+    """Make record the target of add()/put() in this thread."""
+    previous = getattr(_local, "record", None), getattr(_local, "stage", None)
+    _local.record, _local.stage = record, stage
+    try:
+        yield record
+    finally:
+        _local.record, _local.stage = previous
+
+def bound(func):
+    """func running with the caller's record, for helper threads (e.g. a ThreadPoolExecutor)."""
+    record, stage = current(), getattr(_local, "stage", None)
+    def wrapper(*args, **kwargs):
+        with activate(record, stage):
+            return func(*args, **kwargs)
+    return wrapper
+
+@contextmanager
+def span(job: dict, stage: str):
+    """Time a stage of a job, wall time and python CPU time go into job['metrics']."""
+    record = job.setdefault("metrics", new_record())
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        with activate(record, stage):
+            yield record
+    finally:
+        record["stages"][stage] = round(time.perf_counter() - wall, 4)
+        record["python_cpu"][stage] = round(time.thread_time() - cpu, 4)
+
+def add(field: str, amount=1):
+    """Add to a counter of the running span, no-op outside of one."""
+    record = current()
+    if record is not None:
+        with _lock:
+            record[field] += amount
+
+def put(field: str, value):
+    record = current()
+    if record is not None:
+        record[field] = value
+
+def run(cmd: list, check: bool = False, **kwargs):
+    """subprocess.run that books the child's CPU time on the running span.
+
+    Pipe stdout or stderr, not both (they are read one after the other).
+    The child gets no stdin unless asked for: ffmpeg reads keystrokes from it,
+    and `--batch -` reads its lines from ours.
+    """
+    kwargs.setdefault("stdin", subprocess.DEVNULL)
+    if not hasattr(os, "wait4"): # Windows: no per-child rusage
+        return subprocess.run(cmd, check=check, **kwargs)
+    with subprocess.Popen(cmd, **kwargs) as proc:
+        stdout = proc.stdout.read() if proc.stdout else None
+        stderr = proc.stderr.read() if proc.stderr else None
+        reap(proc)
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+def reap(proc: subprocess.Popen):
+    """Wait for proc and book its CPU time on the running span, returns the exit code."""
+    if not hasattr(os, "wait4"):
+        return proc.wait()
+    # Reap it ourselves to get the child's rusage, Popen accepts a preset returncode
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    spent = usage.ru_utime + usage.ru_stime
+    record, stage = current(), getattr(_local, "stage", None)
+    if record is not None and stage:
+        with _lock:
+            record["ffmpeg_cpu"][stage] = round(record["ffmpeg_cpu"].get(stage, 0) + spent, 4)
+    logging.debug("'%s' exited with %d (%.2fs CPU)", proc.args[0], proc.returncode, spent)
+    return proc.returncode
+
+def write(job: dict, path: str = METRICS_PATH):
+    """Append the metrics of a finished job as one JSON line."""
+    record = job.get("metrics") or new_record()
+    line = {
+        "id": job["id"],
+        "song": job["song"],
+        "status": job["status"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "total_seconds": round(sum(record["stages"].values()), 4),
+        **record,
+        "time": time.time(),
+    }
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with _lock, open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+def percentile(values: list, pct: float):
+    """Nearest-rank percentile of a non empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))]
+
+def _distribution(values: list):
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "max": round(max(values), 4),
+        "total": round(sum(values), 4),
+    }
+
+def summary(jobs: list):
+    """Percentiles per stage and totals over the metrics of a run's jobs."""
+    records = [job["metrics"] for job in jobs if job.get("metrics")]
+    result = {"tracks": len(jobs), "measured": len(records), "stages": {}, "ffmpeg_cpu": {}}
+    for field in ("stages", "ffmpeg_cpu"):
+        names = {name for record in records for name in record[field]}
+        for name in sorted(names):
+            result[field][name] = _distribution([r[field][name] for r in records if name in r[field]])
+    totals = [sum(r["stages"].values()) for r in records]
+    if totals:
+        result["total_seconds"] = _distribution(totals)
+    result["bytes_downloaded"] = sum(r["bytes_downloaded"] for r in records)
+    result["search_queries"] = sum(r["search_queries"] for r in records)
+    depths = {}
+    for r in records:
+        if r["fallback_depth"] is not None:
+            depths[r["fallback_depth"]] = depths.get(r["fallback_depth"], 0) + 1
+    result["fallback_depth"] = dict(sorted(depths.items()))
+    return result
+
+# Active profiler per process (3.12+, sys.monitoring allows one and it sees every
+# thread) or per thread (older, sys.setprofile only sees its own), see profiled()
+_profilers = {}
+_profilers_lock = threading.Lock()
+
+def _profiler_key():
+    if sys.version_info >= (3, 12):
+        return os.getpid()
+    return os.getpid(), threading.get_ident()
+
+@contextmanager
+def profiled(directory: str, name: str):
+    """cProfile the block into directory/name.prof, no-op without a directory.
+
+    Per stage call instead of per run: pipeline threads and pool processes
+    are covered too. Overlapping blocks of one process share its profiler: it
+    runs from the first block in to the last one out and is dumped under the
+    first one's name.
+    """
+    if not directory:
+        yield
+        return
+    key = _profiler_key()
+    with _profilers_lock:
+        entry = _profilers.get(key)
+        if entry is None:
+            entry = _profilers[key] = {"profile": cProfile.Profile(), "name": name, "active": 0}
+            entry["profile"].enable()
+        entry["active"] += 1
+    try:
+        yield
+    finally:
+        with _profilers_lock:
+            entry["active"] -= 1
+            done = entry["active"] == 0
+            if done:
+                del _profilers[key]
+                entry["profile"].disable()
+        if done:
+            Path(directory).mkdir(parents=True, exist_ok=True)
+            entry["profile"].dump_stats(os.path.join(directory, f"{entry['name']}.prof"))
+
+def merge_profiles(directory: str, output: str = "combined.prof"):
+    """Merge every .prof of directory into one file, returns its path (None if there are none)."""
+    files = [
+        os.path.join(directory, f) for f in sorted(os.listdir(directory))
+        if f.endswith(".prof") and f != output
+    ] if os.path.isdir(directory) else []
+    if not files:
+        return None
+    stats = pstats.Stats(*files)
+    path = os.path.join(directory, output)
+    stats.dump_stats(path)
+    return path
@@ -0,0 +1,28 @@
+import logging
+import re
+
+def sanitize_filename(song_artists: str):
+    # Split song and artist
+    if ' - ' in song_artists:
+        song_name, artists = song_artists.rsplit(' - ', 1)
+    else:
+        # If no ' - ', treat the whole string as song name
+        song_name = song_artists
+        artists = "Unknown Artist"
+    # Remove invalid characters
+    song_name = re.sub(r'[<>:"/\\|?*]', '', song_name)
+    artists = re.sub(r'[<>:"/\\|?*]', '', artists)
+    # trim to a maximum length
+    max_length_artists = 100
+    max_length_song = 50
+    if len(song_name) > max_length_song:
+        song_name = song_name[:max_length_song].rstrip()
+    if len(artists) > max_length_artists:
+        artists = artists[:max_length_artists].rstrip()
+    logging.debug("%s - %s", song_name, song_artists)
+    #return f'{song_name} - {artists}'
+    song_title_artists = {
+        "title": song_name,
+        "artist": artists
+    }
+    return song_title_artists
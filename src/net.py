@@ -0,0 +1,138 @@
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+
+from src.ratelimit import HIGH, LIMITER
+
+USER_AGENT = "SongDownloader/2.0 ( contact@example.com )"
+
+# Network Settings, changed through configure()
+SETTINGS = {
+    "connect_timeout": 5,
+    "read_timeout": 30,
+    "retries": 5,
+    "backoff": 0.5,      # first retry waits ~backoff seconds, doubling after that
+    "backoff_max": 60,
+}
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+def configure(**settings):
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown network settings: {sorted(unknown)}")
+    SETTINGS.update(settings)
+
+def get_session():
+    """One keep-alive session per process, every host gets its own connection pool."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            import requests # on first use, most runs that find their tracks done never need it
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (seconds or HTTP date), None if unusable."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt: int, retry_after: float = None):
+    """Exponential backoff with jitter, Retry-After wins if the server sent one."""
+    if retry_after is not None:
+        return min(retry_after, SETTINGS["backoff_max"])
+    cap = min(SETTINGS["backoff_max"], SETTINGS["backoff"] * 2 ** attempt)
+    return random.uniform(cap / 2, cap)
+
+def retry_call(func, *args, should_retry=None, describe: str = "", **kwargs):
+    """Call func with retries and backoff.
+
+    should_retry(exception) returns (retry, retry_after_seconds), by default
+    every exception is retried. The last exception is raised once retries run out.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            retry, retry_after = should_retry(e) if should_retry else (True, None)
+            if not retry or attempt >= SETTINGS["retries"]:
+                raise
+            delay = backoff_delay(attempt, retry_after)
+            logging.info("%s failed (%s), retrying in %.1fs", describe or getattr(func, "__name__", "call"), str(e), delay)
+            time.sleep(delay)
+            attempt += 1
+
+def http_get(url: str, priority: int = HIGH, **kwargs):
+    """GET through the shared session, see http_request."""
+    return http_request("GET", url, priority, **kwargs)
+
+def http_post(url: str, priority: int = HIGH, **kwargs):
+    return http_request("POST", url, priority, **kwargs)
+
+def http_request(method: str, url: str, priority: int = HIGH, **kwargs):
+    """Request through the shared session with timeouts and backoff on 429/5xx.
+
+    Every attempt waits for the host's rate limit slot (in the priority lane),
+    a 429/503 slows the host down for every worker.
+    Returns the final response (whatever its status), raises
+    requests.RequestException if the host can't be reached at all.
+    """
+    import requests
+
+    kwargs.setdefault("timeout", (SETTINGS["connect_timeout"], SETTINGS["read_timeout"]))
+    attempt = 0
+    while True:
+        LIMITER.wait(url, priority)
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= SETTINGS["retries"]:
+                raise
+            delay = backoff_delay(attempt)
+            logging.info("%s %s failed (%s), retrying in %.1fs", method, url, str(e), delay)
+        else:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if response.status_code in (429, 503):
+                LIMITER.penalize(url, retry_after)
+            elif response.status_code < 400:
+                LIMITER.reward(url)
+            if response.status_code not in RETRY_STATUS or attempt >= SETTINGS["retries"]:
+                return response
+            delay = backoff_delay(attempt, retry_after)
+            logging.info("%s %s returned %d, retrying in %.1fs", method, url, response.status_code, delay)
+        time.sleep(delay)
+        attempt += 1
+
+def ytdlp_opts():
+    """yt-dlp options so it follows the same timeouts and backoff."""
+    def sleep(n):
+        return backoff_delay(n)
+    return {
+        "socket_timeout": SETTINGS["read_timeout"],
+        "retries": SETTINGS["retries"],
+        "fragment_retries": SETTINGS["retries"],
+        "extractor_retries": SETTINGS["retries"],
+        "retry_sleep_functions": {"http": sleep, "fragment": sleep, "extractor": sleep},
+    }
@@ -0,0 +1,105 @@
+import logging
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Marks the end of the job stream inside a stage queue
+_DONE = object()
+
+def process_pool(workers: int, initializer=None, initargs=()):
+    """Process pool whose workers are forked wherever the platform can.
+
+    Forked workers inherit what the parent set up (shared rate limit buckets,
+    CLI settings, logging) whatever the default start method is (spawn on
+    Windows and macOS, forkserver from Python 3.14). Where there is no fork,
+    initializer(*initargs) has to hand that over.
+    """
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=initializer, initargs=initargs)
+
+def _run_stage(func, job: dict, name: str, pool=None):
+    """Run one stage for one job, a crash only fails that job."""
+    try:
+        if pool is not None:
+            return pool.submit(func, job).result()
+        return func(job)
+    except Exception as e:
+        logging.exception("Stage '%s' crashed for '%s'", name, job.get("song"))
+        job["status"] = "failed"
+        job["error"] = f"{name}: {e}"
+        return job
+
+def run_pipeline(jobs, stages: list, queue_factor: int = 2, initializer=None, initargs=()):
+    """Run jobs through stages concurrently, yields finished jobs as they come out.
+
+    stages is a list of (name, function, kind, workers). 'thread' stages run the
+    function in worker threads (network bound), 'process' stages hand it to a
+    process pool (ffmpeg/CPU bound). Every stage reads from a bounded queue, so
+    a fast stage can't pile up more than queue_factor * workers jobs in front of
+    a slow one. initializer(*initargs) runs in every pool process, see process_pool.
+    """
+    queues = [queue.Queue(maxsize=max(1, workers * queue_factor)) for _, _, _, workers in stages]
+    results = queue.Queue()
+    pools = []
+    threads = []
+
+    for index, (name, func, kind, workers) in enumerate(stages):
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(stages) else results
+        next_workers = stages[index + 1][3] if index + 1 < len(stages) else 1
+        pool = None
+        if kind == "process":
+            pool = process_pool(workers, initializer, initargs)
+            # Fork the workers now, before any stage thread holds a lock
+            # (a fork in the middle of a thread's logging/sqlite call can hang the child)
+            pool.submit(int).result()
+            pools.append(pool)
+        remaining = [workers]
+        lock = threading.Lock()
+
+        def worker(name=name, func=func, inbox=inbox, outbox=outbox, pool=pool,
+                   remaining=remaining, lock=lock, next_workers=next_workers):
+            while True:
+                job = inbox.get()
+                if job is _DONE:
+                    break
+                outbox.put(_run_stage(func, job, name, pool))
+            # Last worker of this stage closes the next one
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    for _ in range(next_workers):
+                        outbox.put(_DONE)
+
+        for n in range(workers):
+            thread = threading.Thread(target=worker, name=f"{name}-{n}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        logging.debug("Stage '%s' started with %d %s worker(s)", name, workers, kind)
+
+    feed_errors = []
+
+    def feed():
+        try:
+            for job in jobs:
+                queues[0].put(job)
+        except Exception as e: # raised by the consumer once the jobs fed so far are through
+            feed_errors.append(e)
+        finally:
+            for _ in range(stages[0][3]):
+                queues[0].put(_DONE)
+
+    threading.Thread(target=feed, name="feeder", daemon=True).start()
+
+    try:
+        while True:
+            job = results.get()
+            if job is _DONE:
+                break
+            yield job
+        if feed_errors:
+            raise feed_errors[0]
+    finally:
+        for pool in pools:
+            pool.shutdown(cancel_futures=True)
@@ -1,68 +1,57 @@
 import argparse
-import csv
-import os
-import platform
+
+from src.ingest import ARTIST_COLUMN, TITLE_COLUMN, iter_rows
+from src.library import LibraryIndex
+from src.matcher import FuzzyMatcher
 
 # --- CONFIG ---
 OUTPUT_M3U = "assets/playlist.m3u"
 
-# Column name from the CSV for song title (depends on export)
-TITLE_COLUMN = "Track Name"  # Exportify usually uses this
-ARTIST_COLUMN = "Artist Name(s)" # And this
-
-def find_song_path(song_name, music_dir):
-    """Search recursively for a file containing the song name (case-insensitive)."""
-    song_lower = song_name.lower()
-    for root, _, files in os.walk(music_dir):
-        for f in files:
-            if song_lower in f.lower():
-                return os.path.join(root, f)
-    return None
-
 if __name__ == "__main__":
     # Argument Parser
     parser = argparse.ArgumentParser(description="m3u file generator")
-    parser.add_argument("--csv", default="", help="CSV file Path")
+    parser.add_argument("--csv", nargs="+", default=[], help="CSV file Path(s) or folders of exports, merged into one playlist")
     parser.add_argument("--music", default="", help="Music Search Folder")
+    parser.add_argument("--min-score", type=float, default=0.8, help="Lowest match confidence (0-1) accepted as found")
+    parser.add_argument("--rebuild-index", action="store_true", help="Rescan the whole music folder instead of only changed dirs")
     args = parser.parse_args()
     
     # Check if everything is there
     if not args.csv:
         print("Non existing csv file path")
+        raise SystemExit(1)
     if not args.music:
         print("Non existing music file path")
-    
-    # Set Args
-    if platform.system() == 'Windows':
-        csv_file = fr"{args.csv}"
-        music_dir = fr"{args.music}"  # Search for Songs in ...
-    elif platform.system() == 'Linux':
-        csv_file = f"{args.csv}"
-        music_dir = f"{args.music}"  # Search for Songs in ...
-    print("Using : ", csv_file)
+        raise SystemExit(1)
+    music_dir = args.music  # Search for Songs in ...
+    print("Using : ", ", ".join(args.csv))
     print("Searching for Music in : ", music_dir)
-    
-    
-    with open(csv_file, newline='', encoding="utf-8") as csvfile:
-        reader = list(csv.DictReader(csvfile))
-        song_names = [row[TITLE_COLUMN] for row in reader]
-        artist = [row[ARTIST_COLUMN] for row in reader]
 
-    found_paths = []
-    missing = []
+    # Library Index, only dirs changed since the last run get rescanned
+    library = LibraryIndex(music_dir)
+    rescanned, total = library.refresh(rebuild=args.rebuild_index)
+    library.load()
+    print(f"Library index: rescanned {rescanned} of {total} dirs, {len(library.files)} files")
+    matcher = FuzzyMatcher(library.files)
 
-    for song, artist in zip(song_names, artist):
-        path = find_song_path(song, music_dir)
-        if path:
-            found_paths.append(path)
-        else:
-            missing.append((song, artist))
+    found = 0
+    missing = []
+    stats = {}
 
+    # Rows are streamed, every match goes straight into the m3u
     with open(OUTPUT_M3U, "w", encoding="utf-8") as m3u:
-        for p in found_paths:
-            m3u.write(p + "\n")
-
-    print(f"✅ Playlist written to {OUTPUT_M3U}")
+        for row in iter_rows(args.csv, stats=stats):
+            song, artist = row[TITLE_COLUMN], row[ARTIST_COLUMN]
+            path, score = matcher.match(song, artist)
+            if path and score >= args.min_score:
+                print(f"[{score:.2f}] {song} - {artist} -> {path}")
+                m3u.write(path + "\n")
+                found += 1
+            else:
+                print(f"[{score:.2f}] {song} - {artist} -> not found" + (f" (closest: {path})" if path else ""))
+                missing.append((song, artist))
+
+    print(f"✅ Playlist written to {OUTPUT_M3U}: {found} tracks from {stats['files']} file(s), {stats['duplicates']} duplicates skipped")
     if missing:
         print("⚠️ Songs not found:")
         for song, artist in missing:
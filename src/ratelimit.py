@@ -0,0 +1,161 @@
+import logging
+import multiprocessing
+import time
+import urllib.parse
+
+# Priority lanes, lower goes first: lookups never queue behind downloads
+HIGH = 0  # metadata, searches
+LOW = 1   # downloads, covers
+
+# Which bucket a hostname belongs to (suffix match)
+HOSTS = {
+    "musicbrainz.org": "musicbrainz",
+    "coverartarchive.org": "coverart",
+    "archive.org": "coverart",  # Cover Art Archive redirects there
+    "youtube.com": "youtube",
+    "youtu.be": "youtube",
+    "googlevideo.com": "youtube",
+    "api.spotify.com": "spotify",
+    "accounts.spotify.com": "spotify",
+}
+
+# requests per second, burst
+DEFAULT_RATES = {
+    "musicbrainz": (1.0, 1),  # their documented limit
+    "coverart": (10.0, 10),
+    "youtube": (1.0, 4),
+    "spotify": (5.0, 10),  # rolling 30s window upstream, batched calls keep us far below it
+}
+
+MIN_RATE_FACTOR = 1 / 16  # adaptive backoff never goes below rate / 16
+RECOVER_STEP = 0.1        # every success gives back 10% of the configured rate
+
+class TokenBucket:
+    """Token bucket whose state lives in shared memory.
+
+    Pool processes forked after it was created (the pipeline's ffmpeg stages,
+    --transcode), or handed it at their start where there is no fork, draw
+    from the same bucket as the threads of the main process.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self._lock = multiprocessing.Lock()
+        self._base = multiprocessing.Value("d", rate, lock=False)
+        self._rate = multiprocessing.Value("d", rate, lock=False)
+        self._burst = multiprocessing.Value("d", burst, lock=False)
+        self._tokens = multiprocessing.Value("d", burst, lock=False)
+        self._updated = multiprocessing.Value("d", time.monotonic(), lock=False)
+        self._blocked_until = multiprocessing.Value("d", 0.0, lock=False)
+        self._waiting_high = multiprocessing.Value("i", 0, lock=False)
+
+    def configure(self, rate: float, burst: int = None):
+        """rate <= 0 means unlimited."""
+        with self._lock:
+            self._base.value = self._rate.value = rate
+            if burst is not None:
+                self._burst.value = self._tokens.value = max(1, burst)
+
+    @property
+    def rate(self):
+        return self._rate.value
+
+    def acquire(self, priority: int = HIGH):
+        """Block until a request may go out, returns the seconds waited."""
+        start = time.monotonic()
+        registered = False
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    rate = self._rate.value
+                    if rate <= 0:
+                        return 0.0
+                    tokens = min(self._burst.value, self._tokens.value + (now - self._updated.value) * rate)
+                    self._tokens.value = tokens
+                    self._updated.value = now
+                    blocked = self._blocked_until.value - now
+                    # A waiting lookup always goes before the next download
+                    yielding = priority != HIGH and self._waiting_high.value > 0
+                    if blocked <= 0 and not yielding and tokens >= 1:
+                        self._tokens.value = tokens - 1
+                        return time.monotonic() - start
+                    if priority == HIGH and not registered:
+                        self._waiting_high.value += 1
+                        registered = True
+                    if blocked > 0:
+                        delay = blocked
+                    elif tokens < 1:
+                        delay = (1 - tokens) / rate
+                    else:
+                        delay = 0.05
+                time.sleep(min(delay, 1.0))
+        finally:
+            if registered:
+                with self._lock:
+                    self._waiting_high.value -= 1
+
+    def penalize(self, retry_after: float = None):
+        """Throttled (429, bot check...): halve the rate and hold everyone back for a while."""
+        with self._lock:
+            if self._base.value <= 0:
+                return
+            rate = max(self._base.value * MIN_RATE_FACTOR, self._rate.value / 2)
+            self._rate.value = rate
+            self._tokens.value = 0.0
+            now = time.monotonic()
+            self._blocked_until.value = max(self._blocked_until.value, now + (retry_after if retry_after is not None else 1 / rate))
+        logging.warning("Slowing down '%s' to %.2f requests/s", self.name, rate)
+
+    def reward(self):
+        """A request went through, creep back up to the configured rate."""
+        if self._rate.value >= self._base.value:
+            return
+        with self._lock:
+            self._rate.value = min(self._base.value, self._rate.value + self._base.value * RECOVER_STEP)
+
+class HostLimiter:
+    """Token buckets per host, shared by every thread and forked worker."""
+
+    def __init__(self, rates: dict = None):
+        self.buckets = {
+            name: TokenBucket(name, rate, burst)
+            for name, (rate, burst) in (rates or DEFAULT_RATES).items()
+        }
+
+    def bucket_for(self, name_or_url: str):
+        """Bucket of a bucket name or URL, None for hosts without a limit."""
+        if name_or_url in self.buckets:
+            return self.buckets[name_or_url]
+        host = (urllib.parse.urlparse(name_or_url).hostname or "").lower()
+        for suffix, name in HOSTS.items():
+            if host == suffix or host.endswith("." + suffix):
+                return self.buckets.get(name)
+        return None
+
+    def wait(self, name_or_url: str, priority: int = HIGH):
+        bucket = self.bucket_for(name_or_url)
+        if bucket is None:
+            return 0.0
+        waited = bucket.acquire(priority)
+        if waited > 0.5:
+            logging.debug("Waited %.1fs for a '%s' slot", waited, bucket.name)
+        return waited
+
+    def penalize(self, name_or_url: str, retry_after: float = None):
+        bucket = self.bucket_for(name_or_url)
+        if bucket is not None:
+            bucket.penalize(retry_after)
+
+    def reward(self, name_or_url: str):
+        bucket = self.bucket_for(name_or_url)
+        if bucket is not None:
+            bucket.reward()
+
+    def configure(self, name: str, rate: float, burst: int = None):
+        if name not in self.buckets:
+            raise ValueError(f"Unknown rate limit '{name}', expected one of {sorted(self.buckets)}")
+        self.buckets[name].configure(rate, burst)
+
+# Shared instance, created at import so forked workers inherit it
+LIMITER = HostLimiter()
@@ -0,0 +1,161 @@
+import logging
+import threading
+
+from src.matcher import normalize, same_version, similarity
+
+MATCH_THRESHOLD = 0.9  # title similarity a track needs to be served from a known release
+MAX_MISSES = 2  # releases of an artist resolved in vain before its tracks stop trying
+
+def _release_group(release: dict):
+    group = release.get("release-group") or {}
+    return group.get("primary-type") or group.get("type"), group.get("secondary-type-list") or []
+
+def is_compilation(release: dict):
+    """Compilation or Various Artists release: not an album of the artist searched for."""
+    _, secondary = _release_group(release)
+    album_artist = first_artist(release) or release.get("artist-credit-phrase") or ""
+    return "Compilation" in secondary or normalize(album_artist) == "various artists"
+
+def candidate_score(recording: dict, release: dict, title: str, artist: str):
+    """How well a (recording, release) search hit fits 'title - artist', 0..1.
+
+    Mostly title/artist similarity, then MusicBrainz' own search score, an
+    official release and not being a compilation. A recording with other
+    version words or numbers (live, remix, "Part II") is pushed down.
+    """
+    title_score = similarity(title, recording.get("title"))
+    # Title only searches can't tell artists apart, every candidate gets the same
+    artist_score = 0.5 if artist == "Unknown Artist" else similarity(artist, recording.get("artist-credit-phrase"))
+    search_score = int(recording.get("ext:score") or 0) / 100
+    _, secondary = _release_group(release)
+    return (
+        0.45 * title_score
+        - 0.3 * (not same_version(title, recording.get("title")))
+        + 0.3 * artist_score
+        + 0.1 * search_score
+        + 0.1 * (release.get("status") == "Official")
+        + 0.05 * ("Compilation" not in secondary)
+    )
+
+def best_candidate(recordings: list, title: str, artist: str):
+    """(recording, release, score) of the best search hit, the earliest release breaks ties."""
+    candidates = [
+        (recording, release, candidate_score(recording, release, title, artist))
+        for recording in recordings
+        for release in recording.get("release-list") or [{}]
+    ]
+    if not candidates:
+        return None
+    # Scores this close are the same match on different releases: the original wins over reissues
+    return min(candidates, key=lambda c: (-round(c[2], 2), c[1].get("date") or "9999"))
+
+def first_artist(credit: dict):
+    """Name of the first credited artist of a recording/release, what filenames use."""
+    names = [c.get("artist", {}).get("name") for c in credit.get("artist-credit", []) if isinstance(c, dict)]
+    return names[0] if names else None
+
+def parse_release(release: dict):
+    """Tracklist of a musicbrainzngs release (get_release_by_id with recordings)."""
+    album_artist = first_artist(release)
+    tracks = []
+    for medium in release.get("medium-list", []):
+        for track in medium.get("track-list", []):
+            recording = track.get("recording") or {}
+            tracks.append({
+                "recording_id": recording.get("id"),
+                "title": track.get("title") or recording.get("title"),
+                "artist": first_artist(recording) or album_artist,
+                "duration_ms": int(track.get("length") or recording.get("length") or 0),
+            })
+    return {
+        "release_id": release.get("id"),
+        "album": release.get("title"),
+        "date": release.get("date"),
+        "artist": album_artist,
+        "genres": [t["name"] for t in release.get("tag-list", []) if "name" in t],
+        "compilation": is_compilation(release),
+        "tracks": tracks,
+    }
+
+class ReleaseIndex:
+    """Tracklists of releases seen this run, so album siblings need no search.
+
+    Every search hit notes its release under the searched artist. When another
+    track of that artist comes up, the release of the latest hit is resolved
+    once (tracklist, durations, cover) and the track is served from it if it's
+    on there, the same goes for every later track of the album. A track costs
+    at most one such lookup, and after MAX_MISSES releases that didn't have
+    the track the artist's tracks are only searched.
+    """
+
+    def __init__(self):
+        self.releases = {}   # release id -> parse_release() result, None if it couldn't be resolved
+        self.by_artist = {}  # normalized artist -> release ids in the order they were seen
+        self.genres = {}     # release id -> genres of the search hit, for releases without tags
+        self.misses = {}     # normalized artist -> releases resolved that didn't have the track
+        self._lock = threading.Lock()
+
+    def note(self, artist: str, release_id: str, genres: list = None):
+        """A search for artist ended up on release_id."""
+        if not release_id:
+            return
+        with self._lock:
+            ids = self.by_artist.setdefault(normalize(artist), [])
+            if release_id in ids:
+                ids.remove(release_id)
+            ids.append(release_id) # latest last
+            self.genres.setdefault(release_id, genres or [])
+
+    def claim(self, artist: str):
+        """Latest release of artist if nobody resolved it yet (it's reserved for the caller), else None."""
+        with self._lock:
+            key = normalize(artist)
+            ids = self.by_artist.get(key)
+            if not ids or ids[-1] in self.releases or self.misses.get(key, 0) >= MAX_MISSES:
+                return None
+            self.releases[ids[-1]] = None # being resolved
+            return ids[-1]
+
+    def miss(self, artist: str):
+        """A release claimed for a track of artist didn't have it."""
+        with self._lock:
+            key = normalize(artist)
+            self.misses[key] = self.misses.get(key, 0) + 1
+
+    def add(self, release_id: str, release: dict):
+        with self._lock:
+            self.releases[release_id] = release
+
+    def match(self, title: str, artist: str):
+        """Metadata of title on a resolved release of artist, None if it isn't on one."""
+        with self._lock:
+            releases = [self.releases.get(i) for i in self.by_artist.get(normalize(artist), [])]
+        best, best_score = None, MATCH_THRESHOLD
+        for release in filter(None, releases):
+            if release.get("compilation"): # noted from a cache hit, the search would have skipped it
+                continue
+            for track in release["tracks"]:
+                if not same_version(title, track["title"]): # the live one isn't the studio one
+                    continue
+                if similarity(artist, track["artist"]) < MATCH_THRESHOLD: # someone else's track
+                    continue
+                score = similarity(title, track["title"])
+                if score >= best_score:
+                    best, best_score = (release, track), score
+        if best is None:
+            return None
+        release, track = best
+        logging.debug("'%s' is track '%s' of release '%s' (%.2f)", title, track["title"], release["album"], best_score)
+        return {
+            "recording_id": track["recording_id"],
+            "title": track["title"],
+            "artist": track["artist"],
+            "duration_ms": track["duration_ms"],
+            "release_id": release["release_id"],
+            "album": release["album"],
+            "date": release["date"],
+            "genres": release["genres"] or self.genres.get(release["release_id"], []),
+        }
+
+# Shared instance, lives as long as the process (a whole batch, or serve)
+RELEASES = ReleaseIndex()
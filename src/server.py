@@ -0,0 +1,185 @@
+import json
+import logging
+import queue
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SERVE_HOST = "127.0.0.1"  # no auth, never listen beyond localhost
+SERVE_PORT = 8765
+
+# Finished/cancelled jobs kept for GET /jobs, the oldest go first
+MAX_FINISHED = 1000
+
+# What GET /jobs shows of a job dict
+STATUS_FIELDS = ["id", "song", "status", "error", "completed", "attempts", "path", "compressed"]
+
+class JobServer:
+    """Job queue of `main.py serve`, fed over localhost HTTP.
+
+    prepare(body) turns a POST /jobs body into job dicts, run(job, cancelled)
+    runs one through the stages and checks cancelled() between them. The
+    worker threads live as long as the server, so what is kept per thread
+    (search YoutubeDL instances, sqlite connections) or per process (HTTP
+    session, caches, rate limits) stays warm from one submission to the next.
+
+        POST   /jobs       {"song", "youtube", "cover"} | {"spotify": URL} | {"lines": [...]}
+        GET    /jobs       queued and running jobs, the last MAX_FINISHED finished ones
+        GET    /jobs/<id>  one job
+        DELETE /jobs/<id>  cancel it (queued: dropped, running: stops after the current stage)
+    """
+
+    def __init__(self, prepare, run, concurrency: int = 2):
+        self.prepare = prepare
+        self.run = run
+        self.concurrency = max(1, concurrency)
+        self.jobs = {}    # id -> job dict, in submission order
+        self.state = {}   # id -> queued | running | finished | cancelled
+        self.queue = queue.Queue()
+        self._cancelled = set()
+        self._lock = threading.Lock()
+
+    def submit(self, body: dict):
+        """Queue the jobs of a request, returns their ids (jobs already queued or running aren't added twice)."""
+        ids = []
+        for job in self.prepare(body):
+            with self._lock:
+                if self.state.get(job["id"]) in ("queued", "running"):
+                    logging.info("'%s' is queued already", job["song"])
+                else:
+                    self.jobs.pop(job["id"], None) # re-submitted: moves to the end
+                    self.jobs[job["id"]] = job
+                    self.state[job["id"]] = "queued"
+                    self._cancelled.discard(job["id"])
+                    self.queue.put(job["id"])
+            ids.append(job["id"])
+        with self._lock:
+            self._evict()
+        logging.info("Queued %d job(s), %d waiting", len(ids), self.queue.qsize())
+        return ids
+
+    def _evict(self):
+        """Forget the oldest jobs that are over beyond MAX_FINISHED (called with the lock held)."""
+        over = [i for i in self.jobs if self.state[i] in ("finished", "cancelled")]
+        for job_id in over[:max(0, len(over) - MAX_FINISHED)]:
+            del self.jobs[job_id], self.state[job_id]
+            self._cancelled.discard(job_id)
+
+    def cancel(self, job_id: str):
+        """False if the job is unknown or already over."""
+        with self._lock:
+            state = self.state.get(job_id)
+            if state == "queued":
+                self.state[job_id] = "cancelled"
+            elif state == "running":
+                self._cancelled.add(job_id)
+            else:
+                return False
+            song = self.jobs[job_id]["song"]
+        logging.info("Cancelled '%s' (%s)", song, state)
+        return True
+
+    def status(self, job_id: str = None):
+        with self._lock:
+            ids = [job_id] if job_id else list(self.jobs)
+            return [
+                {**{field: self.jobs[i].get(field) for field in STATUS_FIELDS}, "state": self.state[i]}
+                for i in ids if i in self.jobs
+            ]
+
+    def _worker(self):
+        while True:
+            job_id = self.queue.get()
+            with self._lock:
+                if self.state.get(job_id) != "queued":
+                    continue
+                self.state[job_id] = "running"
+                job = self.jobs[job_id]
+            try:
+                job = self.run(job, lambda: job_id in self._cancelled)
+            except Exception as e:
+                logging.exception("Job '%s' crashed", job["song"])
+                job["status"], job["error"] = "failed", str(e)
+            with self._lock:
+                self.jobs[job_id] = job
+                stopped = job_id in self._cancelled and job["status"] == "failed"
+                self.state[job_id] = "cancelled" if stopped else "finished"
+
+    def serve(self, host: str = SERVE_HOST, port: int = SERVE_PORT):
+        """Start the workers and answer requests until Ctrl+C."""
+        for n in range(self.concurrency):
+            threading.Thread(target=self._worker, name=f"serve-{n}", daemon=True).start()
+        httpd = ThreadingHTTPServer((host, port), _handler(self))
+        logging.info("Serving on http://%s:%d with %d worker(s)", host, port, self.concurrency)
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            counts = {state: list(self.state.values()).count(state) for state in ("queued", "running")}
+            logging.info(
+                "Stopping: %d running job(s) can go on with --retry-failed, %d queued one(s) have to be submitted again",
+                counts["running"], counts["queued"]
+            )
+        finally:
+            httpd.server_close()
+
+def _handler(server: JobServer):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _job_id(self):
+            parts = self.path.strip("/").split("/")
+            if parts[0] != "jobs" or len(parts) > 2:
+                return None, False
+            return (parts[1] if len(parts) == 2 else None), True
+
+        def do_GET(self):
+            job_id, ok = self._job_id()
+            if not ok:
+                return self._reply(404, {"error": "unknown path"})
+            jobs = server.status(job_id)
+            if job_id and not jobs:
+                return self._reply(404, {"error": f"unknown job '{job_id}'"})
+            self._reply(200, jobs[0] if job_id else jobs)
+
+        def do_POST(self):
+            job_id, ok = self._job_id()
+            if not ok or job_id:
+                return self._reply(404, {"error": "unknown path"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                ids = server.submit(body)
+            except (ValueError, TypeError) as e:
+                return self._reply(400, {"error": str(e)})
+            self._reply(202, {"ids": ids})
+
+        def do_DELETE(self):
+            job_id, ok = self._job_id()
+            if not ok or not job_id:
+                return self._reply(404, {"error": "unknown path"})
+            if not server.cancel(job_id):
+                return self._reply(409, {"error": f"job '{job_id}' isn't queued or running"})
+            self._reply(200, {"cancelled": job_id})
+
+        def log_message(self, format, *args):
+            logging.debug("serve: " + format, *args)
+
+    return Handler
+
+def request(method: str, path: str, body: dict = None, port: int = SERVE_PORT, host: str = SERVE_HOST):
+    """Call a running server, returns (status code, JSON answer). Stdlib only, submitting stays cheap."""
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(
+        f"http://{host}:{port}{path}", data=data, method=method, headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=300) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
@@ -0,0 +1,206 @@
+import logging
+import os
+import re
+import threading
+import time
+
+from src.cache import CACHE, DAY
+from src.ingest import REQUIRED_METADATA
+from src.net import http_get, http_post
+
+SPOTIFY_API = "https://api.spotify.com/v1"
+SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+
+BATCH_SIZE = 50        # most ids the /tracks and /artists endpoints take per call
+PLAYLIST_PAGE = 100    # most items per playlist page
+ARTIST_TTL = 30 * DAY  # genres barely change
+
+_SPOTIFY_ID = re.compile(r"(?:spotify:|open\.spotify\.com/(?:intl-\w+/)?)(track|playlist|album)[:/]([A-Za-z0-9]{22})")
+
+def parse_spotify(value: str):
+    """(kind, id) of a Spotify URL/URI, e.g. ('track', '4uLU6hMCjMI75M1A2tKUQC'), else None."""
+    match = _SPOTIFY_ID.search(value or "")
+    return (match.group(1), match.group(2)) if match else None
+
+class SpotifyError(Exception):
+    pass
+
+class SpotifyClient:
+    """Spotify Web API client that works in batches.
+
+    Tracks are fetched 50 per /tracks call, their artists' genres 50 per
+    /artists call. Genres are cached per artist in memory and in the lookup
+    cache, artists repeat a lot within a playlist and across runs.
+    Credentials come from SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET (client
+    credentials flow).
+    """
+
+    def __init__(self, client_id: str = None, client_secret: str = None,
+                 api_url: str = SPOTIFY_API, token_url: str = SPOTIFY_TOKEN_URL):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.api_url = api_url.rstrip("/")
+        self.token_url = token_url
+        self.calls = 0  # API requests made, token requests not included
+        self._token = None
+        self._token_expires = 0.0
+        self._genres = {}
+        self._lock = threading.Lock()
+
+    def _access_token(self, refresh: bool = False):
+        with self._lock:
+            if self._token and not refresh and time.time() < self._token_expires - 60:
+                return self._token
+            client_id = self.client_id or os.environ.get("SPOTIFY_CLIENT_ID")
+            client_secret = self.client_secret or os.environ.get("SPOTIFY_CLIENT_SECRET")
+            if not client_id or not client_secret:
+                raise SpotifyError("Spotify credentials missing, set SPOTIFY_CLIENT_ID and SPOTIFY_CLIENT_SECRET")
+            response = http_post(self.token_url, data={"grant_type": "client_credentials"}, auth=(client_id, client_secret))
+            if response.status_code != 200:
+                raise SpotifyError(f"Spotify token request failed ({response.status_code})")
+            data = response.json()
+            self._token = data["access_token"]
+            self._token_expires = time.time() + data.get("expires_in", 3600)
+            return self._token
+
+    def _get(self, path: str, params: dict = None):
+        for refresh in (False, True):
+            headers = {"Authorization": f"Bearer {self._access_token(refresh)}"}
+            response = http_get(f"{self.api_url}/{path}", params=params, headers=headers)
+            self.calls += 1
+            if response.status_code != 401: # expired token: once more with a new one
+                break
+        if response.status_code != 200:
+            raise SpotifyError(f"Spotify /{path} failed ({response.status_code})")
+        return response.json()
+
+    def tracks(self, ids: list):
+        """Track objects for ids in the same order (None for unknown ids), 50 per call."""
+        tracks = []
+        for start in range(0, len(ids), BATCH_SIZE):
+            chunk = ids[start:start + BATCH_SIZE]
+            tracks.extend(self._get("tracks", {"ids": ",".join(chunk)}).get("tracks") or [None] * len(chunk))
+        return tracks
+
+    def playlist_tracks(self, playlist_id: str):
+        """Track objects of a playlist, paged through 100 at a time (local files and episodes skipped)."""
+        tracks = []
+        offset = 0
+        while True:
+            page = self._get(f"playlists/{playlist_id}/tracks", {"limit": PLAYLIST_PAGE, "offset": offset})
+            for item in page.get("items", []):
+                track = item.get("track")
+                if track and track.get("type", "track") == "track" and track.get("id"):
+                    tracks.append(track)
+            offset += PLAYLIST_PAGE
+            if not page.get("next") or offset >= page.get("total", 0):
+                return tracks
+
+    def artist_genres(self, artist_ids: list):
+        """{artist id: genres}, only artists in neither cache are fetched (50 per call)."""
+        genres = {}
+        missing = []
+        for artist_id in dict.fromkeys(artist_ids):
+            if artist_id in self._genres:
+                genres[artist_id] = self._genres[artist_id]
+                continue
+            hit, cached = CACHE.get("spotify_artist", artist_id, ARTIST_TTL)
+            if hit:
+                genres[artist_id] = self._genres[artist_id] = cached or []
+            else:
+                missing.append(artist_id)
+        for start in range(0, len(missing), BATCH_SIZE):
+            chunk = missing[start:start + BATCH_SIZE]
+            for artist in self._get("artists", {"ids": ",".join(chunk)}).get("artists") or []:
+                if artist:
+                    genres[artist["id"]] = self._genres[artist["id"]] = artist.get("genres", [])
+                    CACHE.set("spotify_artist", artist["id"], genres[artist["id"]])
+        return genres
+
+    def resolve(self, tracks: list):
+        """Metadata dicts for track objects, genres of all their first artists in as few calls as possible."""
+        artist_ids = [t["artists"][0]["id"] for t in tracks if t and t.get("artists")]
+        genres = self.artist_genres(artist_ids)
+        return [track_metadata(t, genres) if t else None for t in tracks]
+
+    def resolve_ids(self, ids: list):
+        return self.resolve(self.tracks(ids))
+
+def track_metadata(track: dict, genres: dict):
+    """Metadata dict of a Spotify track object, the shape embed_metadata expects."""
+    artists = track.get("artists") or [{}]
+    album = track.get("album") or {}
+    images = album.get("images") or []
+    return {
+        "release_id": None,
+        "title": track.get("name"),
+        "artist": artists[0].get("name"),
+        "artists": [a.get("name") for a in artists if a.get("name")],
+        "album": album.get("name"),
+        "date": (album.get("release_date") or "")[:4] or None,
+        "duration_ms": track.get("duration_ms", 0),
+        "genres": genres.get(artists[0].get("id"), []),
+        "cover_url": images[0]["url"] if images else "https://None",
+        "isrc": (track.get("external_ids") or {}).get("isrc"),
+        "spotify_uri": track.get("uri"),
+    }
+
+def track_record(metadata: dict):
+    """tracks.jsonl style record of resolved metadata, main.py's batch takes it as is."""
+    return {
+        "song": f"{metadata['title']} - {', '.join(metadata['artists']) or metadata['artist']}",
+        **metadata,
+        "complete": all(metadata.get(field) and metadata.get(field) != "https://None" for field in REQUIRED_METADATA),
+    }
+
+def resolve_lines(lines, client: "SpotifyClient" = None):
+    """Replace Spotify track/playlist lines of a batch with resolved records, in batches.
+
+    Other lines (and tracks.jsonl dicts) pass through in their place.
+    """
+    client = client or SPOTIFY
+    pending = []
+
+    def flush():
+        import requests # only batches with Spotify lines need it
+
+        try:
+            records = client.resolve_ids([track_id for _, track_id in pending])
+        except (SpotifyError, requests.RequestException) as e: # the rest of the batch goes on
+            logging.error("Can't resolve %d Spotify track(s): %s", len(pending), str(e))
+            records = [None] * len(pending)
+        for (line, _), metadata in zip(pending, records):
+            if metadata is None:
+                logging.error("Spotify doesn't know '%s', skipping it", line)
+                continue
+            yield track_record(metadata)
+        pending.clear()
+
+    for line in lines:
+        parsed = parse_spotify(line) if isinstance(line, str) else None
+        if parsed and parsed[0] == "track":
+            pending.append((line, parsed[1]))
+            if len(pending) == BATCH_SIZE:
+                yield from flush()
+            continue
+        if pending:
+            yield from flush()
+        if parsed and parsed[0] == "playlist":
+            logging.info("Resolving Spotify playlist '%s'", parsed[1])
+            import requests
+            try:
+                playlist = client.resolve(client.playlist_tracks(parsed[1]))
+            except (SpotifyError, requests.RequestException) as e:
+                logging.error("Can't resolve Spotify playlist '%s': %s", line, str(e))
+                playlist = []
+            for metadata in playlist:
+                yield track_record(metadata)
+        elif parsed:
+            logging.error("Spotify %s links aren't supported (only tracks and playlists): '%s'", parsed[0], line)
+        else:
+            yield line
+    if pending:
+        yield from flush()
+
+# Shared instance, credentials are read on the first request
+SPOTIFY = SpotifyClient()
@@ -0,0 +1,66 @@
+import json
+import os
+import time
+
+from src.cache import SqliteStore
+from src.loudness import content_hash
+
+TRANSCODE_DB = "assets/transcode.sqlite3"
+
+def profile_signature(profile: dict):
+    """Stable text of a profile, a changed codec/bitrate/quality means a new target."""
+    return json.dumps(profile, sort_keys=True)
+
+class TranscodeState(SqliteStore):
+    """What every library transcode target was made from.
+
+    Per (source, profile): the source's size, mtime and content hash plus the
+    profile it was encoded with. A target is only rebuilt if one of them changed
+    or it's gone.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS transcodes ("
+        " source TEXT NOT NULL,"
+        " profile TEXT NOT NULL,"
+        " signature TEXT NOT NULL,"
+        " target TEXT NOT NULL,"
+        " size INTEGER NOT NULL,"
+        " mtime INTEGER NOT NULL,"
+        " hash TEXT NOT NULL,"
+        " created REAL NOT NULL,"
+        " PRIMARY KEY (source, profile))"
+    )
+
+    def __init__(self, path: str = TRANSCODE_DB):
+        super().__init__(path)
+
+    def is_current(self, source: str, name: str, profile: dict, stat: os.stat_result, target: str):
+        """Is target an encode of source as it is now, with this profile?"""
+        row = self._conn().execute(
+            "SELECT signature, target, size, mtime, hash FROM transcodes WHERE source = ? AND profile = ?",
+            (source, name)
+        ).fetchone()
+        if row is None or not os.path.exists(target):
+            return False
+        signature, recorded_target, size, mtime, recorded_hash = row
+        if signature != profile_signature(profile) or recorded_target != target or size != stat.st_size:
+            return False
+        if mtime == stat.st_mtime_ns:
+            return True
+        # Touched (copied, restored from backup) but the same audio
+        if content_hash(source) != recorded_hash:
+            return False
+        with self._conn() as conn:
+            conn.execute("UPDATE transcodes SET mtime = ? WHERE source = ? AND profile = ?", (stat.st_mtime_ns, source, name))
+        return True
+
+    def record(self, source: str, name: str, profile: dict, stat: os.stat_result, target: str, source_hash: str):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO transcodes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, name, profile_signature(profile), target, stat.st_size, stat.st_mtime_ns, source_hash, time.time())
+            )
+
+# Shared instance
+TRANSCODES = TranscodeState()